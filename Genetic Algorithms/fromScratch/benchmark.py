@@ -0,0 +1,171 @@
+'''
+Benchmarks of the genetic searches.
+
+A function, e.g. one solving a problem with genetic.get_best, is run a few times as a warmup and then timed over a
+number of repetitions with a monotonic high resolution clock. Anything it prints is captured, so that it is neither
+lost to a broken stdout nor timed. Results hold the time of every run, their percentiles and, when the function
+returns the Chromosome found, the genomes scored per second. They are written as JSON, and two sets of results are
+compared with a Mann-Whitney U test on their run times, since the time a search takes is far from normal.
+'''
+import io
+import os
+import sys
+import json
+import time
+import platform
+import importlib
+import contextlib
+import numpy as np
+from scipy import stats
+
+PERCENTILES = (5, 50, 95, 99)
+BASELINE_PATH = 'genetic_benchmarks_baseline.json'
+RESULTS_PATH = 'genetic_benchmarks.json'
+
+
+def benchmark(function, name=None, repeats=20, warmup=2, capture=True):
+    """
+    Time a function.
+    :param function: function without arguments. If it returns an object with an Evaluations attribute, like the
+    Chromosome returned by get_best, the evaluations per second are measured too.
+    :param name: name of the case. The name of the function by default.
+    :param repeats: number of timed runs.
+    :param warmup: number of runs before the timed ones, which are not measured.
+    :param capture: whether to capture what the function prints instead of showing it.
+    :return: dict with the measures of the case.
+    """
+    if repeats < 1:
+        raise ValueError('repeats must be at least 1.')
+    if warmup < 0:
+        raise ValueError('warmup must not be negative.')
+
+    seconds = []
+    evaluations = []
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output) if capture else contextlib.nullcontext():
+        for _ in range(warmup):
+            function()
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - start_time)
+            evaluations.append(getattr(result, 'Evaluations', None))
+
+    result = {'name': name or function.__name__,
+              'repeats': repeats,
+              'warmup': warmup,
+              'seconds': seconds,
+              'mean': float(np.mean(seconds)),
+              'std': float(np.std(seconds)),
+              'min': min(seconds),
+              'max': max(seconds),
+              'evaluations': None,
+              'evaluations_per_second': None,
+              'output_lines': output.getvalue().count('\n')}
+    for q, value in zip(PERCENTILES, np.percentile(seconds, PERCENTILES)):
+        result['p{}'.format(q)] = float(value)
+    if None not in evaluations:
+        result['evaluations'] = float(np.mean(evaluations))
+        result['evaluations_per_second'] = sum(evaluations) / sum(seconds) if sum(seconds) > 0 else None
+    return result
+
+
+def run(cases, repeats=20, warmup=2, capture=True):
+    """
+    Benchmark each case and print a table.
+    :param cases: dict with the function of each case, by name.
+    :return: list of results.
+    """
+    results = []
+    print('{:>20} {:>9} {:>9} {:>9} {:>9} {:>11}'.format('case', 'mean', 'p5', 'p50', 'p95', 'evals/sec'))
+    for name, function in cases.items():
+        result = benchmark(function, name, repeats, warmup, capture)
+        results.append(result)
+        speed = '-' if not result['evaluations_per_second'] else '{:.3g}'.format(result['evaluations_per_second'])
+        print('{name:>20} {mean:>9.4f} {p5:>9.4f} {p50:>9.4f} {p95:>9.4f} {:>11}'.format(speed, **result))
+    return results
+
+
+def environment():
+    """Versions and machine that results are measured on, since timings from different ones are not comparable"""
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def save(results, path):
+    """Write the results as JSON, by case name, along with the environment"""
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'cases': {result['name']: result for result in results}}, f,
+                  indent=2)
+
+
+def load(path):
+    """
+    Read the results written by save.
+    :return: dict with the result of each case by name, and the environment they were measured on.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return data['cases'], data['environment']
+
+
+def compare(results, baseline, alpha=0.01, min_change=0.05):
+    """
+    Compare the run times of results with a baseline. Cases missing from either of them are ignored.
+    :param results: list of results from run.
+    :param baseline: dict with the result of each case by name, as read with load.
+    :param alpha: significance level of the Mann-Whitney U test of each case.
+    :param min_change: relative change of the median time below which a case is not flagged, however significant.
+    :return: list with a description of each case whose time changed significantly, and whether it is a
+    regression.
+    """
+    changes = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None:
+            continue
+        p_value = stats.mannwhitneyu(result['seconds'], base['seconds'], alternative='two-sided').pvalue
+        change = np.median(result['seconds']) / np.median(base['seconds']) - 1
+        if p_value < alpha and abs(change) >= min_change:
+            changes.append(('{}: median time went from {:.4g}s to {:.4g}s ({:+.1%}, p-value {:.2g})'.format(
+                result['name'], np.median(base['seconds']), np.median(result['seconds']), change, p_value),
+                bool(change > 0)))
+    return changes
+
+
+def check_baseline(results, path=BASELINE_PATH):
+    """
+    Compare results with the baseline in path, see compare. If there is no baseline, the results become it.
+    :return: list of changes, or None if the results were stored as the baseline.
+    """
+    if not os.path.exists(path):
+        save(results, path)
+        return None
+    baseline, baseline_environment = load(path)
+    if baseline_environment != environment():
+        print('Warning: the baseline was measured on {}'.format(baseline_environment))
+    return compare(results, baseline)
+
+
+if __name__ == '__main__':
+    # Their file names are not valid module names
+    hello_world = importlib.import_module('hello world')
+    one_max = importlib.import_module('oneMax')
+
+    results = run({'hello world': hello_world.test,
+                   'hello world batched': lambda: hello_world.guess_password('Hello World!', population_size=50),
+                   'one max': one_max.test,
+                   'one max batched': lambda: one_max.guess_password(100, population_size=20)})
+    save(results, RESULTS_PATH)
+
+    changes = check_baseline(results)
+    if changes is None:
+        print(f'\nResults stored as the baseline in {BASELINE_PATH}')
+    elif not changes:
+        print('\nNo significant changes against the baseline')
+    else:
+        print('\nSignificant changes against the baseline:')
+        for change, regression in changes:
+            print('{} {}'.format('REGRESSION' if regression else 'Improvement', change))
+        if any(regression for _, regression in changes):
+            sys.exit(1)
@@ -4,33 +4,244 @@ Luis Da Silva
 
 Parent file with classes for implementation of genetic algorithms from scratch
 '''
+import sys
+import time
 import random
+import hashlib
+import threading
 import datetime as dt
-import time
+from collections import OrderedDict
+from multiprocessing import Pool, Event
 import numpy as np
-import sys
+
+# Approximate bytes taken by a cache entry besides its key and value: its node in the ordered dict and its slot
+CACHE_ENTRY_OVERHEAD = 100
+# Seconds between checks of the stop event by the hill climber. Its deadline is checked after every child.
+STOP_CHECK_SECONDS = 0.01
+
+_worker = {}
 
 
 class Chromosome:
-    def __init__(self, genes, fitness):
+    def __init__(self, genes, fitness, evaluations=None, generation=None):
         self.Genes = genes
         self.Fitness = fitness
+        # Number of genomes scored by the search which found it, and the generation in which it did. Each child is a
+        # generation of the hill climber.
+        self.Evaluations = evaluations
+        self.Generation = generation
+        # Statistics of the fitness cache of that search, if it had one. See FitnessCache.stats
+        self.Cache = None
+
 
+class FitnessCache:
+    """
+    Least recently used cache of the fitness of genomes, keyed by a 128 bits hash of their genes.
+    Fitness functions are wrapped with wrap, or wrap_batch for batched ones, and every function wrapped by the same
+    cache shares its entries, so a cache should only be used with one problem and target.
+    :param max_entries: max number of genomes kept.
+    :param max_mb: max approximate memory taken by the entries, in MB. Unbounded by default.
+    """
+    def __init__(self, max_entries=2**16, max_mb=None):
+        if max_entries < 1:
+            raise ValueError('max_entries must be at least 1.')
+        self.max_entries = max_entries
+        self.max_bytes = None if max_mb is None else max_mb * 2**20
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
 
-class Benchmark:
     @staticmethod
-    def run(function):
-        timings = []
-        stdout = sys.stdout
-        for i in range(100):
-            sys.stdout = None
-            start_time = time.time()
-            function()
-            seconds = time.time() - start_time
-            timings.append(seconds)
-            mean = np.mean(timings)
-            sys.stdout = stdout
-            print('{} {:3.2f} {:3.2f}'.format(1 + i, mean, np.std(timings) if i>1 else 0))
+    def key(genes):
+        """Hash of a genome, given as a sequence or an array of genes"""
+        genes = np.asarray(genes)
+        # Object arrays would be hashed by the address of their items
+        data = repr(genes.tolist()).encode() if genes.dtype == object else genes.dtype.str.encode() + genes.tobytes()
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get(self, key):
+        """Fitness of a genome by its key, or None if it is not cached"""
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return fitness
+
+    def put(self, key, fitness):
+        """Store the fitness of a genome, evicting the least recently used genomes if the cache is full"""
+        if key in self.entries:
+            return
+        self.entries[key] = fitness
+        self.nbytes += sys.getsizeof(key) + sys.getsizeof(fitness) + CACHE_ENTRY_OVERHEAD
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes
+                                                       and len(self.entries) > 1):
+            old_key, old_fitness = self.entries.popitem(last=False)
+            self.nbytes -= sys.getsizeof(old_key) + sys.getsizeof(old_fitness) + CACHE_ENTRY_OVERHEAD
+            self.evictions += 1
+
+    def wrap(self, get_fitness):
+        """Fitness function of the genes and the target returning the cached fitness when there is one"""
+        def get_cached_fitness(genes, target=None):
+            key = self.key(genes)
+            fitness = self.get(key)
+            if fitness is None:
+                fitness = get_fitness(genes=genes, target=target)
+                self.put(key, fitness)
+            return fitness
+        return get_cached_fitness
+
+    def wrap_batch(self, get_batch_fitness):
+        """Batched fitness function which only scores the genomes which are not cached, in a single call"""
+        def get_cached_batch_fitness(genomes, target=None):
+            keys = [self.key(genes) for genes in genomes]
+            cached = [self.get(key) for key in keys]
+            missing = {}
+            for i, (key, fitness) in enumerate(zip(keys, cached)):
+                if fitness is None:
+                    # Genomes repeated within the batch are scored once
+                    missing.setdefault(key, i)
+            if missing:
+                rows = list(missing.values())
+                for key, fitness in zip(missing, get_batch_fitness(genomes[rows], target=target)):
+                    self.put(key, fitness)
+                    cached[missing[key]] = fitness
+                for i, key in enumerate(keys):
+                    if cached[i] is None:
+                        cached[i] = cached[missing[key]]
+            return np.array(cached)
+        return get_cached_batch_fitness
+
+    def stats(self):
+        """Dict with the hits, misses, evictions, entries and approximate MB of the cache"""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'mb': self.nbytes / 2**20}
+
+
+class ProgressReporter:
+    """
+    Display function for get_best and evolve which only shows some of the improvements.
+    An improvement is shown if min_seconds have passed or every_generations generations have gone by since the last
+    one shown, and the last improvement is always shown when the search ends. Improvements waiting to be shown are
+    replaced by newer ones, so with a background thread a slow display is skipped over instead of slowing the search.
+    :param display: function called with the Chromosome and the start time, like the display of get_best.
+    :param min_seconds: seconds between improvements shown.
+    :param every_generations: generations after which an improvement is shown anyway.
+    :param background: whether to call display and on_event from a background thread.
+    :param on_event: function called with a progress event for every improvement shown. Events are dicts with the
+    fitness, generation, evaluations, improvements, seconds, improvements_per_second and evaluations_per_second.
+    """
+    def __init__(self, display=None, min_seconds=0.5, every_generations=None, background=True, on_event=None):
+        self.display = display
+        self.min_seconds = min_seconds
+        self.every_generations = every_generations
+        self.on_event = on_event
+        self.improvements = 0
+        self.shown = 0
+        self.last_event = None
+        self._pending = None
+        self._start = None
+        self._last_time = None
+        self._last_generation = None
+
+        # Slot with the next improvement to show, read by the background thread
+        self._queued = None
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __call__(self, chromosome, start_time):
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        self.improvements += 1
+        generation = chromosome.Generation or 0
+        if self._last_time is None or now - self._last_time >= self.min_seconds or \
+                (self.every_generations and generation - self._last_generation >= self.every_generations):
+            self._show(chromosome, start_time, now)
+        else:
+            # Genes changed in place by the search are only copied if it is shown
+            self._pending = (chromosome, start_time)
+
+    def flush(self):
+        """Show the last improvement if it was not shown, and wait until it is displayed"""
+        if self._pending is not None:
+            self._show(*self._pending, time.perf_counter())
+        with self._condition:
+            self._condition.wait_for(lambda: self._queued is None and not self._busy)
+
+    def close(self):
+        """Flush and stop the background thread"""
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _show(self, chromosome, start_time, now):
+        self._pending = None
+        self._last_time = now
+        self._last_generation = chromosome.Generation or 0
+        self.shown += 1
+        seconds = now - self._start
+        evaluations = chromosome.Evaluations
+        event = {'fitness': chromosome.Fitness,
+                 'generation': chromosome.Generation,
+                 'evaluations': evaluations,
+                 'improvements': self.improvements,
+                 'seconds': seconds,
+                 'improvements_per_second': self.improvements / seconds if seconds > 0 else None,
+                 'evaluations_per_second': evaluations / seconds if evaluations and seconds > 0 else None}
+        self.last_event = event
+        snapshot = Chromosome(list(chromosome.Genes), chromosome.Fitness, evaluations, chromosome.Generation)
+
+        if self._thread is None:
+            self._display(snapshot, start_time, event)
+            return
+        with self._condition:
+            self._queued = (snapshot, start_time, event)
+            self._condition.notify_all()
+
+    def _display(self, chromosome, start_time, event):
+        if self.display is not None:
+            self.display(chromosome, start_time)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queued is not None or self._closed)
+                if self._queued is None:
+                    return
+                queued, self._queued = self._queued, None
+                self._busy = True
+            try:
+                self._display(*queued)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
 
 
 def _generate_parent(length, geneSet, target, get_fitness):
@@ -38,33 +249,330 @@ def _generate_parent(length, geneSet, target, get_fitness):
     while len(genes) < length:
         sampleSize = min(length - len(genes), len(geneSet))
         genes.extend(random.sample(geneSet, sampleSize))
-    fitness = get_fitness(genes, target=target)
+    fitness = get_fitness(genes=genes, target=target)
     return Chromosome(genes, fitness)
 
 
 def _mutate(genes, geneSet, target, get_fitness):
-    index = random.randrange(0, len(genes))
-    newGene, alternate = random.sample(geneSet, 2)
-    genes[index] = alternate if newGene == genes[index] else newGene
+    # The child gets its own copy, so that the parent is left as it was if the child is discarded
+    genes = genes[:]
+    _mutate_gene(genes, geneSet)
     fitness = get_fitness(target=target, genes=genes)
     return Chromosome(genes, fitness)
 
 
-def get_best(get_fitness, optimalFitness, geneSet, display, target=None, start_time=None):
-    random.seed()
+def _mutate_gene(genes, geneSet):
+    """Change a random gene in place. Returns its index and its previous value"""
+    index = random.randrange(0, len(genes))
+    newGene, alternate = random.sample(geneSet, 2)
+    oldGene = genes[index]
+    genes[index] = alternate if newGene == oldGene else newGene
+    return index, oldGene
+
+
+def get_best(get_fitness, optimalFitness, geneSet, display, target=None, start_time=None, get_batch_fitness=None,
+             population_size=None, get_delta_fitness=None, cache=None, seed=None, max_seconds=None, stop=None,
+             **kwargs):
+    """
+    Search genes reaching the optimal fitness. Genomes have optimalFitness genes. The search hill climbs from a
+    single parent, scoring one child at a time, unless it is given a batched fitness function or a population size.
+    :param get_fitness: function of the genes and the target returning the fitness of a genome.
+    :param optimalFitness: fitness at which the search stops.
+    :param geneSet: possible genes, as a list or a string.
+    :param display: function called with each improved Chromosome and the start time, e.g. a ProgressReporter.
+    :param target: passed to the fitness function.
+    :param start_time: start time passed to display. Now by default.
+    :param get_batch_fitness: function scoring many genomes at once, see evolve. If given, or if population_size is,
+    the search is run by evolve, with get_fitness scoring the genomes one by one when this is not given.
+    :param population_size: number of genomes kept by evolve.
+    :param get_delta_fitness: function of the parent's fitness, the index of the changed gene, its old and new
+    values and the target, returning the fitness of the child. If given, the hill climber scores children with it
+    and get_fitness only scores the first parent. Children are then made by changing the parent's genes in place,
+    so display is given a copy of each improvement, unless it is a ProgressReporter, which copies the ones it shows.
+    :param cache: FitnessCache memoizing get_fitness and get_batch_fitness, or True for a new one. Its statistics
+    are set as the Cache of the returned Chromosome.
+    :param seed: seed of the search. A random one by default.
+    :param max_seconds: stop after this many seconds even if the optimal fitness was not reached.
+    :param stop: event, e.g. a threading or multiprocessing Event, stopping the search when it is set.
+    :param kwargs: other parameters of evolve.
+    :return: best Chromosome.
+    """
+    if cache is True:
+        cache = FitnessCache()
+    if cache is not None:
+        get_fitness = cache.wrap(get_fitness)
+        if get_batch_fitness is not None:
+            get_batch_fitness = cache.wrap_batch(get_batch_fitness)
+
+    if get_batch_fitness is not None or population_size is not None:
+        if get_batch_fitness is None:
+            get_batch_fitness = _batch_of(get_fitness)
+        best = evolve(get_batch_fitness, optimalFitness, geneSet, display, target=target, start_time=start_time,
+                      population_size=population_size or 100, seed=seed, max_seconds=max_seconds, stop=stop,
+                      **kwargs)
+    else:
+        best = _hill_climb(get_fitness, optimalFitness, geneSet, display, target, start_time, get_delta_fitness, seed,
+                           max_seconds, stop)
+    if cache is not None:
+        best.Cache = cache.stats()
+    return best
+
+
+def _hill_climb(get_fitness, optimalFitness, geneSet, display, target, start_time, get_delta_fitness, seed=None,
+                max_seconds=None, stop=None):
+    random.seed(seed)
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+    check_stop = deadline is not None or stop is not None
+    # The clock is read after every child, as children may take from microseconds to seconds to score
+    next_check = min(time.perf_counter() + STOP_CHECK_SECONDS, deadline or np.inf)
+    if display is None:
+        display = _no_display
+    elif get_delta_fitness is not None and not isinstance(display, ProgressReporter):
+        # Children change the genes of the parent in place, so the display gets copies it may keep
+        display = _copying_display(display)
     if start_time is None:
         start_time = dt.datetime.now()
     if isinstance(geneSet, str):
         geneSet = list(geneSet)
     bestParent = _generate_parent(optimalFitness, geneSet, target, get_fitness)
+    bestParent.Evaluations, bestParent.Generation = 1, 0
     display(bestParent, start_time)
 
-    while True:
+    evaluations = 1
+
+    if get_delta_fitness is not None:
+        genes = bestParent.Genes
+        while bestParent.Fitness < optimalFitness:
+            if check_stop and time.perf_counter() >= next_check:
+                if _stopped(deadline, stop):
+                    break
+                next_check = min(time.perf_counter() + STOP_CHECK_SECONDS, deadline or np.inf)
+            index, oldGene = _mutate_gene(genes, geneSet)
+            fitness = get_delta_fitness(bestParent.Fitness, index, oldGene, genes[index], target=target)
+            evaluations += 1
+            if bestParent.Fitness >= fitness:
+                genes[index] = oldGene
+                continue
+
+            bestParent = Chromosome(genes, fitness, evaluations, evaluations - 1)
+            display(bestParent, start_time)
+        bestParent.Evaluations = evaluations
+        _flush(display)
+        return bestParent
+
+    while bestParent.Fitness < optimalFitness:
+        if check_stop and time.perf_counter() >= next_check:
+            if _stopped(deadline, stop):
+                break
+            next_check = min(time.perf_counter() + STOP_CHECK_SECONDS, deadline or np.inf)
         child = _mutate(bestParent.Genes, geneSet, target, get_fitness)
+        evaluations += 1
         if bestParent.Fitness >= child.Fitness:
             continue
 
+        child.Evaluations, child.Generation = evaluations, evaluations - 1
         display(child, start_time)
-        if child.Fitness >= optimalFitness:
+        bestParent = child
+    bestParent.Evaluations = evaluations
+    _flush(display)
+    return bestParent
+
+
+def _no_display(chromosome, start_time):
+    pass
+
+
+def _copying_display(display):
+    """Display called with a copy of each Chromosome"""
+    def display_copy(chromosome, start_time):
+        display(Chromosome(list(chromosome.Genes), chromosome.Fitness, chromosome.Evaluations,
+                           chromosome.Generation), start_time)
+    return display_copy
+
+
+def _stopped(deadline, stop):
+    """Whether a search has run out of time or has been stopped"""
+    return (deadline is not None and time.perf_counter() >= deadline) or (stop is not None and stop.is_set())
+
+
+def _flush(display):
+    """Show the last improvement when the display is a ProgressReporter"""
+    if isinstance(display, ProgressReporter):
+        display.flush()
+
+
+def _batch_of(get_fitness):
+    """Batched fitness function scoring each genome with get_fitness"""
+    def get_batch_fitness(genomes, target=None):
+        return np.array([get_fitness(genes=genes.tolist(), target=target) for genes in genomes])
+    return get_batch_fitness
+
+
+def evolve(get_batch_fitness, optimalFitness, geneSet, display=None, target=None, start_time=None, length=None,
+           population_size=100, n_children=None, n_mutations=1, max_generations=None, seed=None, max_seconds=None,
+           stop=None):
+    """
+    Population based search. Genomes are the rows of a matrix with the index in geneSet of each of their genes.
+    Each generation, every child copies the fitter of two random parents and changes n_mutations of its genes to a
+    different one. Parents and children then compete, and the fittest population_size survive, parents first when
+    tied.
+    :param get_batch_fitness: function of a matrix with a genome per row, holding the genes themselves, and the
+    target, returning an array with the fitness of each genome.
+    :param optimalFitness: fitness at which the search stops.
+    :param geneSet: possible genes, as a list or a string.
+    :param display: function called with each improved best Chromosome and the start time, e.g. a
+    ProgressReporter.
+    :param target: passed to the fitness function.
+    :param start_time: start time passed to display. Now by default.
+    :param length: number of genes of a genome. optimalFitness by default, as in get_best.
+    :param population_size: number of genomes kept.
+    :param n_children: number of children per generation. As many as the population by default.
+    :param n_mutations: genes changed in each child.
+    :param max_generations: stop after this many generations even if the optimal fitness was not reached.
+    :param seed: seed of the search.
+    :param max_seconds: stop after this many seconds even if the optimal fitness was not reached.
+    :param stop: event stopping the search when it is set.
+    :return: best Chromosome.
+    """
+    if population_size < 1:
+        raise ValueError('population_size must be at least 1.')
+    if len(geneSet) < 2:
+        raise ValueError('geneSet must have at least 2 genes.')
+    if start_time is None:
+        start_time = dt.datetime.now()
+    rng = np.random.default_rng(seed)
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+    genes = np.array(list(geneSet))
+    n_genes = len(genes)
+    length = optimalFitness if length is None else length
+    n_children = population_size if n_children is None else n_children
+    dtype = np.min_scalar_type(n_genes - 1)
+
+    # The population is kept sorted from the fittest genome
+    population = rng.integers(n_genes, size=(population_size, length), dtype=dtype)
+    fitness = np.asarray(get_batch_fitness(genes[population], target=target))
+    order = _fittest_first(fitness)
+    population, fitness = population[order], fitness[order]
+    if display is not None:
+        display(Chromosome(genes[population[0]].tolist(), fitness[0], population_size, 0), start_time)
+
+    rows = np.repeat(np.arange(n_children), n_mutations)
+    generation = 0
+    while fitness[0] < optimalFitness and (max_generations is None or generation < max_generations):
+        if _stopped(deadline, stop):
             break
-        bestParent = child
\ No newline at end of file
+        generation += 1
+        best_fitness = fitness[0]
+        # Binary tournaments pick the parents
+        first, second = rng.integers(population_size, size=(2, n_children))
+        parents = np.where(fitness[first] >= fitness[second], first, second)
+        children = population[parents]
+
+        # Adding a non-zero offset modulo the number of genes always gives a different gene
+        columns = rng.integers(length, size=len(rows))
+        offsets = rng.integers(1, n_genes, size=len(rows))
+        children[rows, columns] = (children[rows, columns] + offsets) % n_genes
+        children_fitness = np.asarray(get_batch_fitness(genes[children], target=target))
+
+        candidates = np.concatenate([population, children])
+        candidates_fitness = np.concatenate([fitness, children_fitness])
+        survivors = _fittest_first(candidates_fitness)[:population_size]
+        population = candidates[survivors]
+        fitness = candidates_fitness[survivors]
+
+        if fitness[0] > best_fitness and display is not None:
+            display(Chromosome(genes[population[0]].tolist(), fitness[0], population_size + generation * n_children,
+                               generation), start_time)
+    _flush(display)
+    return Chromosome(genes[population[0]].tolist(), fitness[0], population_size + generation * n_children,
+                      generation)
+
+
+def _fittest_first(fitness):
+    """Indices sorting the fitness in decreasing order, the first ones first when tied"""
+    # A stable sort of the reversed array, reversed back, since negating would overflow unsigned fitness
+    return len(fitness) - 1 - np.argsort(fitness[::-1], kind='stable')[::-1]
+
+
+def _init_portfolio_worker(stop, deadline):
+    """Give the worker the event stopping every search and the time.time() at which they must all have ended"""
+    _worker['stop'] = stop
+    _worker['deadline'] = deadline
+
+
+def _portfolio_search(args):
+    seed, get_fitness, optimalFitness, geneSet, kwargs = args
+    stop, deadline = _worker['stop'], _worker['deadline']
+    # Searches which had not started when another one found the optimum or time ran out are cancelled
+    max_seconds = None if deadline is None else deadline - time.time()
+    if stop.is_set() or (max_seconds is not None and max_seconds <= 0):
+        return seed, None, 0.
+    start_time = time.perf_counter()
+    best = get_best(get_fitness, optimalFitness, geneSet, None, seed=seed, max_seconds=max_seconds, stop=stop,
+                    **kwargs)
+    return seed, best, time.perf_counter() - start_time
+
+
+def get_best_portfolio(get_fitness, optimalFitness, geneSet, n_searches=4, workers=None, seeds=None,
+                       max_seconds=None, stop_first=True, verbose=True, **kwargs):
+    """
+    Run get_best with different seeds in a pool of processes, since the time a search takes varies a lot with its
+    seed. Functions must be defined at the top level of a module, so that they can be sent to the processes.
+    :param get_fitness: function of the genes and the target returning the fitness of a genome.
+    :param optimalFitness: fitness at which the searches stop.
+    :param geneSet: possible genes, as a list or a string.
+    :param n_searches: number of searches.
+    :param workers: number of processes. As many as searches by default.
+    :param seeds: seed of each search. 0 to n_searches - 1 by default.
+    :param max_seconds: seconds after which every search stops and the best genome found is returned. They are
+    counted from the call for the whole portfolio, so searches still queued by then are cancelled.
+    :param stop_first: whether to stop the other searches when one finds the optimum. Otherwise every search runs
+    to the end, which gives the time to solution of each seed.
+    :param verbose: print the outcome of each search.
+    :param kwargs: other parameters of get_best, e.g. target or get_delta_fitness.
+    :return: dict with the best Chromosome and its seed, and a list with the seed, fitness, seconds, evaluations and
+    whether it was solved or cancelled for each search. The time to solution holds the number of searches solved
+    and the min, median, mean and max seconds they took.
+    """
+    seeds = list(range(n_searches)) if seeds is None else list(seeds)
+    if not seeds:
+        raise ValueError('There must be at least one search.')
+    workers = len(seeds) if workers is None else workers
+    if workers < 1:
+        raise ValueError('workers must be at least 1.')
+
+    # Workers are separate processes, so the deadline is given in wall clock time
+    deadline = None if max_seconds is None else time.time() + max_seconds
+    stop = Event()
+    tasks = [(seed, get_fitness, optimalFitness, geneSet, kwargs) for seed in seeds]
+    searches = []
+    best = best_seed = None
+    with Pool(workers, initializer=_init_portfolio_worker, initargs=(stop, deadline)) as pool:
+        for seed, chromosome, seconds in pool.imap_unordered(_portfolio_search, tasks):
+            if chromosome is None:
+                searches.append({'seed': seed, 'fitness': None, 'seconds': 0., 'evaluations': 0, 'solved': False,
+                                 'cancelled': True})
+                continue
+            solved = bool(chromosome.Fitness >= optimalFitness)
+            searches.append({'seed': seed, 'fitness': chromosome.Fitness, 'seconds': seconds,
+                             'evaluations': chromosome.Evaluations, 'solved': solved,
+                             'cancelled': not solved and stop.is_set()})
+            if best is None or chromosome.Fitness > best.Fitness:
+                best, best_seed = chromosome, seed
+            if verbose:
+                print('Seed {}: fitness {} in {:.3f}s{}'.format(seed, chromosome.Fitness, seconds,
+                                                              ' (solved)' if solved else ''))
+            if solved and stop_first:
+                stop.set()
+
+    times = [search['seconds'] for search in searches if search['solved']]
+    time_to_solution = {'solved': len(times), 'searches': len(searches),
+                        'min': min(times) if times else None,
+                        'median': float(np.median(times)) if times else None,
+                        'mean': float(np.mean(times)) if times else None,
+                        'max': max(times) if times else None}
+    if verbose and times:
+        print('Solved {} of {} searches. Time to solution: min {:.3f}s, median {:.3f}s, max {:.3f}s'.format(
+            len(times), len(searches), time_to_solution['min'], time_to_solution['median'], time_to_solution['max']))
+    return {'best': best, 'seed': best_seed, 'searches': sorted(searches, key=lambda search: search['seed']),
+            'time_to_solution': time_to_solution}
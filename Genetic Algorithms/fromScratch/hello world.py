@@ -6,6 +6,7 @@ Hello world to genetic algorithms.
 This file receives a target string and then uses a genetic algortihm to recreate it.
 '''
 import datetime as dt
+import numpy as np
 import genetic
 
 
@@ -13,24 +14,36 @@ def get_fitness(target, genes):
     return sum(1 for expected, actual in zip(target, genes) if expected == actual)
 
 
+def get_delta_fitness(fitness, index, old_gene, new_gene, target):
+    return fitness - (old_gene == target[index]) + (new_gene == target[index])
+
+
+def get_batch_fitness(genes, target):
+    return (genes == np.array(list(target))).sum(axis=1)
+
+
 def display(chromosome, startTime):
     timeDiff = dt.datetime.now() - startTime
     print("{}, {}, {}".format(''.join(chromosome.Genes), chromosome.Fitness, timeDiff))
 
 
-def guess_password(target):
+def guess_password(target, population_size=None):
     geneSet = " abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!."
     start_time = dt.datetime.now()
     optimal_fitness = len(target)
-    genetic.get_best(get_fitness, optimal_fitness, geneSet, display, target=target, start_time=start_time)
+    # With a population, every generation is scored at once
+    batch_fitness = None if population_size is None else get_batch_fitness
+    return genetic.get_best(get_fitness, optimal_fitness, geneSet, display, target=target, start_time=start_time,
+                            get_batch_fitness=batch_fitness, population_size=population_size,
+                            get_delta_fitness=get_delta_fitness)
 
 
 def test():
     target = 'Hello World!'
-    guess_password(target)
+    return guess_password(target)
 
 
 if __name__ == '__main__':
-    # genetic.Benchmark.run(test)
+    # Run benchmark.py to time it
     target = 'Hello World!'
     guess_password(target)
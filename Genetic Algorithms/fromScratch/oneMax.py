@@ -13,17 +13,35 @@ def get_fitness(genes, target=None):
     return sum(genes)
 
 
+def get_delta_fitness(fitness, index, old_gene, new_gene, target=None):
+    return fitness - old_gene + new_gene
+
+
+def get_batch_fitness(genes, target=None):
+    return genes.sum(axis=1)
+
+
 def display(chromosome, startTime):
     timeDiff = dt.datetime.now() - startTime
     print("{}, {}, {}".format(''.join((str(e) for e in chromosome.Genes)), chromosome.Fitness, timeDiff))
 
 
-def guess_password(lenght = 10, target=None):
+def guess_password(lenght = 10, target=None, population_size=None, min_seconds=0.5):
     geneSet = [0,1]
     start_time = dt.datetime.now()
-    genetic.get_best(get_fitness, lenght, geneSet, display, start_time=start_time)
+    # With a population, every generation is scored at once
+    batch_fitness = None if population_size is None else get_batch_fitness
+    # Printing long genomes takes longer than finding them, so only some improvements are shown, from another thread
+    with genetic.ProgressReporter(display, min_seconds) as reporter:
+        return genetic.get_best(get_fitness, lenght, geneSet, reporter, start_time=start_time,
+                                get_batch_fitness=batch_fitness, population_size=population_size,
+                                get_delta_fitness=get_delta_fitness)
+
+
+def test():
+    return guess_password(100)
 
 
 if __name__ == '__main__':
-    # genetic.Benchmark.run(test)
+    # Run benchmark.py to time it
     guess_password(100)
\ No newline at end of file
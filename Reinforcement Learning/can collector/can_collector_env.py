@@ -0,0 +1,630 @@
+'''
+Headless simulation of the can collector robot game.
+
+Implements the same rules as the playable game without drawing anything, so that it can be simulated as fast as
+the CPU allows. Cells are numbered row by row, row 0 being the top one. Every move costs 1 point and drains
+between 0 and 4 units of battery, which is refilled when the robot moves onto the recharge station. Cans are worth
+4 points. If the battery goes flat, the robot loses 25 points and is carried back to the recharge station.
+
+Boards keep an occupancy grid, so picking up a can is a single lookup, and an index of the free cells: a
+permutation of the cells with those without a can first, along with the slot of each cell in it. A can is added or
+removed by swapping two slots, and a new can is placed by drawing one slot, whatever the size of the board.
+The robot's cell never holds a can, so it is excluded from the draw by swapping it to the last free slot.
+'''
+
+import numpy as np
+
+UP, DOWN, LEFT, RIGHT, WAIT = range(5)
+MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+FULL_BATTERY = 60
+LOW_BATTERY = 20
+MAX_DRAIN = 4
+MOVE_REWARD = -1
+CAN_REWARD = 4
+DEAD_REWARD = -25
+
+# Observations encode the contents of the robot's cell and its 4 neighbours (empty, can or wall), whether the
+# battery is low and whether the robot is on the recharge station
+EMPTY, CAN, WALL = range(3)
+N_OBSERVATIONS = 3 ** 5 * 2 * 2
+
+# Random numbers are drawn in blocks of this size, which is much faster than drawing them one at a time
+RANDOM_BLOCK = 4096
+
+
+def board_tables(rows, columns):
+    """
+    Tables describing the moves on a board.
+    :param rows: number of rows of the board.
+    :param columns: number of columns of the board.
+    :return: array of shape (5, cells) with the cell reached with each action from each cell (the same cell if the
+    move hits a wall), part of the observation of each cell given by its walls and array of shape (4, cells) with the
+    weight in the observation of a can in each neighbour, 0 if it is a wall.
+    """
+    cells = np.arange(rows * columns).reshape(rows, columns)
+    padded = np.pad(cells, 1, constant_values=-1)
+    moves = [np.where(padded[1+dx:1+dx+rows, 1+dy:1+dy+columns] < 0, cells,
+                      padded[1+dx:1+dx+rows, 1+dy:1+dy+columns]).ravel() for dx, dy in MOVES]
+    moves = np.stack(moves + [cells.ravel()])
+
+    walls = moves[:WAIT] == cells.ravel()
+    weights = 3 ** np.arange(1, WAIT + 1)[:, None]
+    return moves, (WALL * weights * walls).sum(axis=0), np.where(walls, 0, weights)
+
+
+class CanCollectorEnv:
+    """
+    Can collector game without rendering.
+    Each step is a Python call, which keeps a single board below 10^6 steps/sec. Use CanCollectorBatch to go faster.
+    :param rows: number of rows of the board.
+    :param columns: number of columns of the board.
+    :param max_cans: max number of cans on the board at once.
+    :param max_steps: number of steps of a game.
+    :param initial_cans: number of cans on the board at the start of a game.
+    :param spawn_interval: mean number of steps between new cans. If None, cans are only added by add_can.
+    :param seed: seed of the random generator.
+    """
+    def __init__(self, rows=10, columns=10, max_cans=10, max_steps=200, initial_cans=5, spawn_interval=1,
+                 seed=None):
+        if rows < 1 or columns < 1:
+            raise ValueError('The board must have at least one row and one column.')
+        if initial_cans > max_cans or max_cans >= rows * columns:
+            raise ValueError('There must be fewer cans than cells on the board.')
+        if spawn_interval is not None and spawn_interval <= 0:
+            raise ValueError('spawn_interval must be positive.')
+
+        self.rows = rows
+        self.columns = columns
+        self.max_cans = max_cans
+        self.max_steps = max_steps
+        self.initial_cans = initial_cans
+        self.spawn_interval = spawn_interval
+        self.rng = np.random.default_rng(seed)
+
+        # Tables as lists, with the neighbours of each cell which are not walls along with their weight
+        moves, wall_code, weights = board_tables(rows, columns)
+        self._next = moves.tolist()
+        self._wall_code = wall_code.tolist()
+        self._neighbours = [[(int(moves[a, cell]), int(weights[a, cell])) for a in range(WAIT) if weights[a, cell]]
+                            for cell in range(rows * columns)]
+
+        # Cans are kept in a bytearray, which is faster to index one cell at a time, and exposed as a numpy view
+        self._cans = None
+        self.cans = None
+        self.position = None
+        self.recharge = None
+        self.battery = 0
+        self.n_cans = 0
+        self.cans_recollected = 0
+        self.score = 0
+        self.steps = 0
+        self.dead = False
+        self._drains = []
+        self._next_drain = 0
+        self._uniforms = []
+        self._next_uniform = 0
+        self._free = None
+        self._slot = None
+        self._n_free = 0
+        self._intervals = []
+        self._next_interval = 0
+        self._next_spawn = 0
+
+        # Function called with the cell of every can added, e.g. to record the game
+        self.on_can_added = None
+
+    def reset(self):
+        """
+        Start a new game. The robot and the recharge station are placed on a random cell.
+        :return: observation.
+        """
+        self._cans = bytearray(self.rows * self.columns)
+        self.cans = np.frombuffer(self._cans, dtype=bool)
+        self._free = list(range(self.rows * self.columns))
+        self._slot = list(range(self.rows * self.columns))
+        self._n_free = self.rows * self.columns
+        self.position = self.recharge = int(self.rng.integers(self.rows * self.columns))
+        self.battery = FULL_BATTERY
+        self.n_cans = 0
+        self.cans_recollected = 0
+        self.score = 0
+        self.steps = 0
+        self.dead = False
+        self.add_can(self.initial_cans)
+        self._schedule_spawn()
+        return self.observe()
+
+    @property
+    def random_state(self):
+        """State of the random generator along with the numbers drawn in advance, which fully determines a game"""
+        return (self.rng.bit_generator.state, list(self._drains), self._next_drain, list(self._uniforms),
+                self._next_uniform, list(self._intervals), self._next_interval)
+
+    @random_state.setter
+    def random_state(self, state):
+        self.rng.bit_generator.state = state[0]
+        self._drains, self._next_drain = list(state[1]), state[2]
+        self._uniforms, self._next_uniform = list(state[3]), state[4]
+        self._intervals, self._next_interval = list(state[5]), state[6]
+
+    @property
+    def battery_state(self):
+        return 'Low' if self.battery <= LOW_BATTERY else 'High'
+
+    @property
+    def done(self):
+        return self.steps >= self.max_steps
+
+    def cell(self, position):
+        """Row and column of a cell"""
+        return divmod(position, self.columns)
+
+    def can_move(self, action):
+        """Whether an action moves the robot, i.e. it does not hit a wall"""
+        return action != WAIT and self._next[action][self.position] != self.position
+
+    def add_can(self, n=1):
+        """Put n cans on random cells without a can nor the robot"""
+        for _ in range(min(n, self._n_free - 1)):
+            # Leave the robot's cell out of the draw in the last free slot
+            last = self._n_free - 1
+            self._swap(self._slot[self.position], last)
+            cell = self._free[int(self._random_uniform() * last)]
+            self._swap(self._slot[cell], last)
+            self._n_free = last
+            self._cans[cell] = True
+            self.n_cans += 1
+            if self.on_can_added is not None:
+                self.on_can_added(cell)
+
+    def _swap(self, i, j):
+        """Swap two slots of the free cells index"""
+        free, slot = self._free, self._slot
+        free[i], free[j] = free[j], free[i]
+        slot[free[i]] = i
+        slot[free[j]] = j
+
+    def step(self, action):
+        """
+        Advance the game one step. Moves against a wall leave the robot where it is but still cost a move.
+        :param action: UP, DOWN, LEFT, RIGHT or WAIT, which only lets time pass.
+        :return: observation, reward and whether the game is over.
+        """
+        # Attributes are read into locals and written back once, and observe and _schedule_spawn are inlined, as this
+        # runs millions of times
+        position = self.position
+        battery = self.battery
+        cans = self._cans
+        reward = 0
+        steps = self.steps = self.steps + 1
+        dead = False
+        if action != WAIT:
+            position = self._next[action][position]
+            reward = MOVE_REWARD
+            if position == self.recharge:
+                battery = FULL_BATTERY
+
+            next_drain = self._next_drain
+            try:
+                battery -= self._drains[next_drain]
+            except IndexError:
+                self._drains = self.rng.integers(0, MAX_DRAIN + 1, RANDOM_BLOCK).tolist()
+                next_drain = 0
+                battery -= self._drains[next_drain]
+            self._next_drain = next_drain + 1
+            if battery <= 0:
+                reward += DEAD_REWARD
+                battery = FULL_BATTERY
+                position = self.recharge
+                dead = True
+            self.battery = battery
+            self.position = position
+        self.dead = dead
+
+        if cans[position]:
+            cans[position] = False
+            self._swap(self._slot[position], self._n_free)
+            self._n_free += 1
+            self.n_cans -= 1
+            self.cans_recollected += 1
+            reward += CAN_REWARD
+
+        if steps >= self._next_spawn:
+            if self.n_cans < self.max_cans:
+                self.add_can()
+            try:
+                self._next_spawn = steps + self._intervals[self._next_interval]
+                self._next_interval += 1
+            except IndexError:
+                self._schedule_spawn()
+
+        self.score += reward
+        observation = self._wall_code[position] + cans[position]
+        for target, weight in self._neighbours[position]:
+            if cans[target]:
+                observation += weight
+        if battery <= LOW_BATTERY:
+            observation += 3 ** 5
+        if position == self.recharge:
+            observation += 2 * 3 ** 5
+        return observation, reward, steps >= self.max_steps
+
+    def observe(self):
+        """Observation of the robot, an integer lower than N_OBSERVATIONS"""
+        position = self.position
+        cans = self._cans
+        observation = self._wall_code[position] + cans[position]
+        for target, weight in self._neighbours[position]:
+            if cans[target]:
+                observation += weight
+        if self.battery <= LOW_BATTERY:
+            observation += 3 ** 5
+        if position == self.recharge:
+            observation += 2 * 3 ** 5
+        return observation
+
+    def _random_uniform(self):
+        if self._next_uniform == len(self._uniforms):
+            self._uniforms = self.rng.random(RANDOM_BLOCK).tolist()
+            self._next_uniform = 0
+        self._next_uniform += 1
+        return self._uniforms[self._next_uniform - 1]
+
+    def _schedule_spawn(self):
+        if self.spawn_interval is None:
+            self._next_spawn = np.inf
+            return
+        if self._next_interval == len(self._intervals):
+            intervals = self.rng.normal(self.spawn_interval, self.spawn_interval / 5, RANDOM_BLOCK)
+            self._intervals = np.maximum(np.rint(intervals), 1).astype(int).tolist()
+            self._next_interval = 0
+        self._next_spawn = self.steps + self._intervals[self._next_interval]
+        self._next_interval += 1
+
+
+class GameClock:
+    """
+    Fixed timestep clock driving a CanCollectorEnv like the playable game: the robot moves when an action is given,
+    a step passes anyway after some idle time and new cans appear every few seconds. Time is counted in ticks and
+    every random draw comes from the environment's generator, so a game may be fast-forwarded or replayed with
+    identical results.
+    :param env: CanCollectorEnv. Its spawn_interval should be None, as the clock adds the cans.
+    :param tick_seconds: simulated seconds per tick.
+    :param spawn_seconds: mean seconds between new cans.
+    :param idle_seconds: seconds without moving after which a step passes.
+    :param recorder: TrajectoryRecorder of the environment, which is given every game played and every tick where
+    something happened.
+    """
+    def __init__(self, env, tick_seconds=1/60, spawn_seconds=1, idle_seconds=2, recorder=None):
+        if tick_seconds <= 0:
+            raise ValueError('tick_seconds must be positive.')
+        self.env = env
+        self.tick_seconds = tick_seconds
+        self.spawn_seconds = spawn_seconds
+        self.idle_ticks = idle_seconds / tick_seconds
+        self.ticks = 0
+        self.last_step = 0
+        self.last_spawn = 0
+        self.spawn_ticks = 0
+        self.log = []
+        self._recorder = None
+        self.recorder = recorder
+        self._random_state = None
+
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        # New cans only go to the recorder in use, so that none are kept while recording is paused
+        if self._recorder is not None and self.env.on_can_added == self._recorder.add_can:
+            self.env.on_can_added = None
+        if recorder is not None:
+            self.env.on_can_added = recorder.add_can
+        self._recorder = recorder
+
+    def reset(self):
+        """
+        Start a new game, remembering the random state of the environment so that it can be replayed.
+        :return: observation.
+        """
+        self._random_state = self.env.random_state
+        observation = self.env.reset()
+        self.ticks = self.last_step = self.last_spawn = 0
+        self.log = []
+        self._schedule_spawn()
+        if self.recorder is not None:
+            self.recorder.reset(self.ticks)
+        return observation
+
+    def tick(self, action=None):
+        """
+        Advance the clock one tick.
+        :param action: move made during this tick, if any. Moves against a wall are ignored, as in the game.
+        :return: whether the game is over.
+        """
+        env = self.env
+        if env.done:
+            return True
+        self.ticks += 1
+        stepped = None
+        if action is not None and env.can_move(action):
+            env.step(action)
+            self.log.append((self.ticks, action))
+            self.last_step = self.ticks
+            stepped = action
+        elif self.ticks - self.last_step > self.idle_ticks:
+            env.step(WAIT)
+            self.last_step = self.ticks
+            stepped = WAIT
+
+        if self.ticks - self.last_spawn > self.spawn_ticks:
+            if env.n_cans < env.max_cans:
+                env.add_can()
+            self.last_spawn = self.ticks
+            self._schedule_spawn()
+        if self.recorder is not None:
+            self.recorder.record(self.ticks, stepped)
+        return env.done
+
+    def fast_forward(self, ticks=None, policy=None):
+        """
+        Run the clock as fast as possible.
+        :param ticks: number of ticks to run. Until the game is over by default.
+        :param policy: function receiving the environment and the tick and returning an action or None.
+        :return: whether the game is over.
+        """
+        done = self.env.done
+        n = 0
+        while not done and (ticks is None or n < ticks):
+            done = self.tick(None if policy is None else policy(self.env, self.ticks))
+            n += 1
+        return done
+
+    def rewind(self):
+        """
+        Go back to the start of the game started by the last reset.
+        :return: list of (tick, action) with the moves made in it.
+        """
+        if self._random_state is None:
+            raise ValueError('There is no game to rewind, the clock has not been reset.')
+        log = self.log
+        self.env.random_state = self._random_state
+        self.reset()
+        return log
+
+    def replay(self, log=None, ticks=None):
+        """
+        Play again the game started by the last reset.
+        :param log: list of (tick, action) to replay. The moves made since the last reset by default.
+        :param ticks: number of ticks to run. Until the last move of the log by default.
+        :return: whether the game is over.
+        """
+        played = self.rewind()
+        log = played if log is None else list(log)
+        ticks = (log[-1][0] if log else 0) if ticks is None else ticks
+        actions = dict(log)
+        return self.fast_forward(ticks, lambda env, tick: actions.get(tick + 1))
+
+    def _schedule_spawn(self):
+        self.spawn_ticks = self.env.rng.normal(self.spawn_seconds, self.spawn_seconds / 5) / self.tick_seconds
+
+
+class CanCollectorBatch:
+    """
+    Many can collector games played in lockstep, with the same rules as CanCollectorEnv.
+    The state of every board is stored in stacked arrays and all boards advance with a single step call. Boards
+    whose game is over start a new one straight away.
+    Each board draws its random numbers from its own stream, given by its seed and how many numbers it has drawn,
+    so its games only depend on its seed and the actions it receives, not on the rest of the batch.
+    :param n_boards: number of boards.
+    :param rows: number of rows of each board.
+    :param columns: number of columns of each board.
+    :param max_cans: max number of cans on a board at once.
+    :param max_steps: number of steps of a game.
+    :param initial_cans: number of cans on a board at the start of a game.
+    :param spawn_interval: mean number of steps between new cans. If None, no cans are added during a game.
+    :param seed: seed from which the seed of each board is derived, or sequence with the seed of each board.
+    """
+    def __init__(self, n_boards, rows=10, columns=10, max_cans=10, max_steps=200, initial_cans=5, spawn_interval=1,
+                 seed=None):
+        if n_boards < 1:
+            raise ValueError('There must be at least one board.')
+        if rows < 1 or columns < 1:
+            raise ValueError('The board must have at least one row and one column.')
+        if initial_cans > max_cans or max_cans >= rows * columns:
+            raise ValueError('There must be fewer cans than cells on the board.')
+        if spawn_interval is not None and spawn_interval <= 0:
+            raise ValueError('spawn_interval must be positive.')
+
+        self.n_boards = n_boards
+        self.rows = rows
+        self.columns = columns
+        self.max_cans = max_cans
+        self.max_steps = max_steps
+        self.initial_cans = initial_cans
+        self.spawn_interval = spawn_interval
+
+        if np.ndim(seed):
+            if len(seed) != n_boards:
+                raise ValueError('There must be one seed per board.')
+            sequences = [np.random.SeedSequence(board_seed) for board_seed in seed]
+        else:
+            sequences = np.random.SeedSequence(seed).spawn(n_boards)
+        self._keys = np.array([sequence.generate_state(1, np.uint64)[0] for sequence in sequences])
+        self._draws = np.zeros(n_boards, dtype=np.uint64)
+
+        self._next, self._wall_code, self._weights = board_tables(rows, columns)
+        self._boards = np.arange(n_boards)
+        # Cans are indexed through a flat view, which is faster than indexing rows and columns
+        self._offsets = self._boards * rows * columns
+
+        n_cells = rows * columns
+        self.cans = np.zeros((n_boards, n_cells), dtype=bool)
+        self._flat_cans = self.cans.reshape(-1)
+        self._free = np.zeros((n_boards, n_cells), dtype=int)
+        self._flat_free = self._free.reshape(-1)
+        self._slot = np.zeros((n_boards, n_cells), dtype=int)
+        self._flat_slot = self._slot.reshape(-1)
+        self._n_free = np.zeros(n_boards, dtype=int)
+        self.position = np.zeros(n_boards, dtype=int)
+        self.recharge = np.zeros(n_boards, dtype=int)
+        self.battery = np.zeros(n_boards, dtype=int)
+        self.n_cans = np.zeros(n_boards, dtype=int)
+        self.cans_recollected = np.zeros(n_boards, dtype=int)
+        self.score = np.zeros(n_boards, dtype=int)
+        self.steps = np.zeros(n_boards, dtype=int)
+        self.dead = np.zeros(n_boards, dtype=bool)
+        self.next_spawn = np.zeros(n_boards, dtype=int)
+
+        # Outcome of the last finished game of each board
+        self.episodes = np.zeros(n_boards, dtype=int)
+        self.final_score = np.zeros(n_boards, dtype=int)
+        self.final_cans = np.zeros(n_boards, dtype=int)
+
+    def reset(self, boards=None):
+        """
+        Start a new game on some boards.
+        :param boards: indexes or boolean mask of the boards to reset. All of them by default.
+        :return: observation of every board.
+        """
+        boards = self._boards if boards is None else self._boards[boards]
+        self.cans[boards] = False
+        self._free[boards] = self._slot[boards] = np.arange(self.rows * self.columns)
+        self._n_free[boards] = self.rows * self.columns
+        self.position[boards] = self.recharge[boards] = (self._random(boards)[0] * self.rows * self.columns).astype(int)
+        self.battery[boards] = FULL_BATTERY
+        self.n_cans[boards] = 0
+        self.cans_recollected[boards] = 0
+        self.score[boards] = 0
+        self.steps[boards] = 0
+        self.dead[boards] = False
+        for _ in range(self.initial_cans):
+            self._add_can(boards, self._random(boards)[0])
+        self._schedule_spawn(boards, *self._random(boards, 2))
+        return self.observe()
+
+    def step(self, actions):
+        """
+        Advance every board one step. Boards whose game ends are reset, so their observation is that of a new game.
+        :param actions: array with the action of each board, see CanCollectorEnv.step.
+        :return: observation and reward of each board and whether its game ended.
+        """
+        actions = np.asarray(actions)
+        moving = actions != WAIT
+        position = self._next[actions, self.position]
+        reward = np.where(moving, MOVE_REWARD, 0)
+
+        # Random numbers are drawn for every board, so that all boards advance their streams alike
+        drain, cell, normal1, normal2 = self._random(n=4)
+        battery = np.where(moving & (position == self.recharge), FULL_BATTERY, self.battery)
+        battery -= (drain * (MAX_DRAIN + 1)).astype(int) * moving
+        self.dead = battery <= 0
+        reward[self.dead] += DEAD_REWARD
+        self.battery = np.where(self.dead, FULL_BATTERY, battery)
+        self.position = position = np.where(self.dead, self.recharge, position)
+
+        collected = self._flat_cans[self._offsets + position]
+        self._flat_cans[self._offsets + position] = False
+        if collected.any():
+            boards = self._boards[collected]
+            self._swap(boards, self._flat_slot[self._offsets[boards] + position[boards]], self._n_free[boards])
+            self._n_free[boards] += 1
+        self.n_cans -= collected
+        self.cans_recollected += collected
+        reward += CAN_REWARD * collected
+
+        self.steps += 1
+        due = self.steps >= self.next_spawn
+        if due.any():
+            spawn = due & (self.n_cans < self.max_cans)
+            self._add_can(self._boards[spawn], cell[spawn])
+            self._schedule_spawn(self._boards[due], normal1[due], normal2[due])
+
+        self.score += reward
+        done = self.steps >= self.max_steps
+        if done.any():
+            self.episodes += done
+            self.final_score[done] = self.score[done]
+            self.final_cans[done] = self.cans_recollected[done]
+            self.reset(done)
+        return self.observe(), reward, done
+
+    def observe(self):
+        """Observation of the robot of each board, see CanCollectorEnv.observe"""
+        position = self.position
+        observation = self._wall_code[position] + self._flat_cans[self._offsets + position]
+        for action in range(WAIT):
+            observation += self._weights[action, position] * self._flat_cans[self._offsets +
+                                                                              self._next[action, position]]
+        observation += 3 ** 5 * (self.battery <= LOW_BATTERY) + 2 * 3 ** 5 * (position == self.recharge)
+        return observation
+
+    def _random(self, boards=None, n=1):
+        """
+        Next numbers of the splitmix64 stream of each board as n uniform numbers in [0, 1), two per number drawn.
+        :return: array of shape (n, boards).
+        """
+        boards = self._boards if boards is None else boards
+        draws = (n + 1) // 2
+        z = self._keys[boards] + (self._draws[boards] + np.arange(draws, dtype=np.uint64)[:, None]) * \
+            np.uint64(0x9E3779B97F4A7C15)
+        self._draws[boards] += np.uint64(draws)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+        return np.concatenate((z >> np.uint64(32), z & np.uint64(2 ** 32 - 1)))[:n] * 2. ** -32
+
+    def _swap(self, boards, i, j):
+        """Swap two slots of the free cells index of each board"""
+        offsets = self._offsets[boards]
+        cell_i, cell_j = self._flat_free[offsets + i], self._flat_free[offsets + j]
+        self._flat_free[offsets + i] = cell_j
+        self._flat_free[offsets + j] = cell_i
+        self._flat_slot[offsets + cell_j] = i
+        self._flat_slot[offsets + cell_i] = j
+
+    def _add_can(self, boards, uniform):
+        """Put a can on a random cell without a can nor the robot of each board"""
+        # Leave the robot's cell out of the draw in the last free slot
+        last = self._n_free[boards] - 1
+        offsets = self._offsets[boards]
+        self._swap(boards, self._flat_slot[offsets + self.position[boards]], last)
+        slots = (uniform * last).astype(int)
+        cells = self._flat_free[offsets + slots]
+        self._swap(boards, slots, last)
+        self._n_free[boards] = last
+        self._flat_cans[offsets + cells] = True
+        self.n_cans[boards] += 1
+
+    def _schedule_spawn(self, boards, uniform1, uniform2):
+        if self.spawn_interval is None:
+            self.next_spawn[boards] = np.iinfo(int).max
+            return
+        # Normal jitter by the Box-Muller transform
+        normal = np.sqrt(-2 * np.log(1 - uniform1)) * np.cos(2 * np.pi * uniform2)
+        interval = np.maximum(np.rint(self.spawn_interval * (1 + normal / 5)), 1).astype(int)
+        self.next_spawn[boards] = self.steps[boards] + interval
+
+
+if __name__ == '__main__':
+    import time
+
+    env = CanCollectorEnv(seed=0)
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 4, 10 ** 6).tolist()
+    start_time = time.perf_counter()
+    for action in actions:
+        if env.step(action)[2]:
+            env.reset()
+    print(f'Single board: {len(actions) / (time.perf_counter() - start_time):.0f} steps/sec')
+
+    batch = CanCollectorBatch(1000, seed=0)
+    batch.reset()
+    actions = np.random.default_rng(0).integers(0, 4, (1000, batch.n_boards))
+    start_time = time.perf_counter()
+    for board_actions in actions:
+        batch.step(board_actions)
+    print(f'Batch of {batch.n_boards} boards: {actions.size / (time.perf_counter() - start_time):.0f} steps/sec')
@@ -5,18 +5,27 @@ Luis Da Silva.
 Implements a playable version of the can collector robot game.
 '''
 
+import time
+from collections import deque
 import arcade
 import numpy as np
-import random
-import time
+from can_collector_env import CanCollectorEnv, GameClock, UP, DOWN, LEFT, RIGHT
+from can_collector_recording import TrajectoryRecorder, TrajectoryReader
+
+KEY_ACTIONS = {arcade.key.UP: UP, arcade.key.DOWN: DOWN, arcade.key.LEFT: LEFT, arcade.key.RIGHT: RIGHT}
 
 
 class CanCollector(arcade.Window):
     """
-    Main application class.
+    Main application class. The rules live in can_collector_env, this window only draws the game and forwards the
+    keys pressed to it. Time is simulated by a GameClock fed with the frames' time, so a game with a given seed and
+    the same moves on the same ticks always plays out the same way, and it can be replayed after it is over.
+    Texts are laid out once and only again when they change, and the board is a static shape batch, so frames stay
+    cheap on large boards. Press "F" to show the frame time.
     """
     def __init__(self, row_count, column_count, width, height,
-                 margin, screen_title, max_cans=10, seconds=1, max_steps=200):
+                 margin, screen_title, max_cans=10, seconds=1, max_steps=200, seed=None, tick_seconds=1/60,
+                 policy=None, policy_seconds=0.25, record=None, playback=None, show_frame_time=False):
         self.box_width = width
         self.box_height = height
         self.box_margin = margin
@@ -24,85 +33,87 @@ class CanCollector(arcade.Window):
         self.screen_height = (height + margin) * row_count + margin + 30
         self.rows = row_count
         self.columns = column_count
+        # Icons are sized for 50 pixels boxes
+        self.sprite_scale = 0.09 * min(width, height) / 50
 
         super().__init__(self.screen_width, self.screen_height, screen_title)
         arcade.set_background_color(arcade.color.WHITE)
 
+        # New cans appear with time, so the clock adds them instead of the environment
+        self.env = CanCollectorEnv(row_count, column_count, max_cans, max_steps, spawn_interval=None, seed=seed)
+        self.clock = GameClock(self.env, tick_seconds, spawn_seconds=seconds)
+        self.lag = 0
+        self.pending_action = None
+        self.replay_actions = None
+
+        # A policy, e.g. a learned one, may play instead of the keyboard. It moves every policy_seconds.
+        self.policy = policy
+        self.policy_ticks = policy_seconds / tick_seconds
+
+        # Games played may be recorded to the folder record, and a BoardReplay of a recorded game may be shown
+        # instead of playing. The replay has the attributes of the environment which are drawn, so it takes its place.
+        self.recorder = None if record is None else TrajectoryRecorder(record, self.env)
+        self.playback = playback
+        if playback is not None:
+            self.env = playback
+
         self.board = None
 
         self.player = None
         self.player_list = None
         self.can_list = None
-        self.n_cans = 0
-        self.max_cans = max_cans
-        self.cans_recollected = 0
+        self.can_sprites = None
         self.recharge = None
         self.recharge_list = None
         self.dead = 0
-        self.score = 0
-        self.steps = 0
-        self.step_time = None
-        self.max_steps = max_steps
-        self.battery_state = 'High'
-        self.battery = 0
-
-        self.game_over = False
-
-        self.start_time = None
-        self.min_seconds = seconds
-
-        self.first_row = self.get_y(0)
-        self.last_row = self.get_y(self.rows - 1)
-        self.first_col = self.get_x(0)
-        self.last_col = self.get_x(self.columns - 1)
         self.change_activated = 0
 
+        # Text objects by name, with the text and color they were laid out with
+        self.texts = {}
+        # Time taken to draw the last frames and when they started
+        self.show_frame_time = show_frame_time
+        self.frame_times = deque(maxlen=60)
+        self.frame_starts = deque(maxlen=60)
+
+    @property
+    def game_over(self):
+        return self.env.done
+
     def setup(self):
+        if self.playback is not None:
+            self.playback.reset()
+        else:
+            self.clock.recorder = self.recorder
+            self.clock.reset()
+        self.lag = 0
+        self.pending_action = None
+        self.replay_actions = None
+
         # Set up board
         self.board = new_board(self.rows, self.columns)
         self.board_list = arcade.ShapeElementList()
-        self.centers = []
         for row in range(len(self.board)):
             for column in range(len(self.board[0])):
-                x = self.get_x(column)
-                y = self.get_y(row)
-                square = arcade.create_rectangle_filled(x, y, self.box_width, self.box_height, arcade.color.EGGSHELL)
+                square = arcade.create_rectangle_filled(self.get_x(column), self.get_y(row), self.box_width,
+                                                        self.box_height, arcade.color.EGGSHELL)
                 self.board_list.append(square)
-                self.centers.append((x, y))
 
         # Set up player
         self.player_list = arcade.SpriteList()
-        self.player = arcade.Sprite('icons/bot.png', 0.09)
-        position = random.choice(self.centers)
-        self.player.center_x = position[0]
-        self.player.center_y = position[1]
+        self.player = arcade.Sprite('icons/bot.png', self.sprite_scale)
         self.player_list.append(self.player)
 
         # Set up recharge station
         self.recharge_list = arcade.SpriteList()
-        self.recharge = arcade.Sprite('icons/recharge.png', 0.09)
-        self.recharge.center_x = position[0]
-        self.recharge.center_y = position[1]
+        self.recharge = arcade.Sprite('icons/recharge.png', self.sprite_scale)
+        self.recharge.center_x, self.recharge.center_y = self.get_center(self.env.recharge)
         self.recharge_list.append(self.recharge)
-
-        # Set up battery
-        self.reset_battery()
         self.dead = 0
 
         # Set up Cans
         self.can_list = arcade.SpriteList()
-        self.n_cans = 0
-        self.cans_recollected = 0
-        self.add_can(5)
-
-        # Score
-        self.score = 0
-
-        # Miscellaneous
-        self.start_time = time.time()
-        self.step_time = time.time()
-        self.game_over = False
-        self.steps = 0
+        self.can_sprites = {}
+        self.sync_sprites()
 
     def get_x(self, column):
         return (self.box_margin + self.box_width) * column + self.box_margin + self.box_width // 2
@@ -111,25 +122,35 @@ class CanCollector(arcade.Window):
         return self.screen_height - (self.box_margin + self.box_height) * (row+1) + \
                                   self.box_margin + self.box_height // 2
 
-    def add_can(self, n=1):
-        positions = []
-        for c in range(n):
-            can = arcade.Sprite('icons/can.png', 0.09)
-            while True:
-                position = random.choice(self.centers)
-                if position not in positions:
-                    positions.append(position)
-                    break
-            can.center_x = position[0]
-            can.center_y = position[1]
+    def get_center(self, position):
+        row, column = self.env.cell(position)
+        return self.get_x(column), self.get_y(row)
+
+    def sync_sprites(self):
+        """Move the sprites to where the environment has the robot and the cans"""
+        self.player.center_x, self.player.center_y = self.get_center(self.env.position)
+
+        # Only the sprites of cans which were picked up or added change
+        if self.env.n_cans == len(self.can_sprites) and all(self.env.cans[cell] for cell in self.can_sprites):
+            return
+        cells = set(np.flatnonzero(self.env.cans).tolist())
+        for cell in set(self.can_sprites) - cells:
+            self.can_sprites.pop(cell).kill()
+        for cell in cells - set(self.can_sprites):
+            can = arcade.Sprite('icons/can.png', self.sprite_scale)
+            can.center_x, can.center_y = self.get_center(cell)
             self.can_list.append(can)
-        self.n_cans += n
-
-    def add_new_cans_with_time_check(self, n=1):
-        if time.time() - self.start_time > np.random.normal(self.min_seconds, self.min_seconds/5):
-            if self.n_cans < self.max_cans:
-                self.add_can(n)
-            self.start_time = time.time()
+            self.can_sprites[cell] = can
+
+    def draw_text(self, name, text, x, y, color=arcade.color.BLACK, font_size=12, **kwargs):
+        """Draw a text, which is laid out again only if its text or color changed since it was last drawn"""
+        cached = self.texts.get(name)
+        if cached is None:
+            cached = self.texts[name] = [arcade.Text(text, x, y, color, font_size, **kwargs), text, color]
+        elif cached[1] != text or cached[2] != color:
+            cached[0].text = cached[1] = text
+            cached[0].color = cached[2] = color
+        cached[0].draw()
 
     def draw_game(self):
         # Draw sprites
@@ -139,130 +160,118 @@ class CanCollector(arcade.Window):
         self.player_list.draw()
 
         # Print score
-        arcade.draw_text(f"Score: {self.score}", 10, 15, arcade.color.BLACK)
-        arcade.draw_text(f"Recollected cans: {self.cans_recollected}", 80, 15, arcade.color.BLACK)
-        color = arcade.color.GREEN if self.battery_state == 'High' else arcade.color.RED
-        arcade.draw_text(f"Battery: {self.battery_state}", 225, 15, color)
-        arcade.draw_text(f"Steps: {self.steps}", 315, 15, arcade.color.BLACK)
+        env = self.env
+        self.draw_text('score', f"Score: {env.score}", 10, 15)
+        self.draw_text('cans', f"Recollected cans: {env.cans_recollected}", 80, 15)
+        color = arcade.color.GREEN if env.battery_state == 'High' else arcade.color.RED
+        self.draw_text('battery', f"Battery: {env.battery_state}", 225, 15, color)
+        self.draw_text('steps', f"Steps: {env.steps}", 315, 15)
         if self.dead:
-            arcade.draw_text(f"BATTERY DEAD", self.screen_width / 2, self.screen_height / 2, arcade.color.RED, 24,
-                             bold=True, anchor_x='center')
+            self.draw_text('dead', "BATTERY DEAD", self.screen_width / 2, self.screen_height / 2, arcade.color.RED,
+                           24, bold=True, anchor_x='center')
             self.dead += 1
 
     def draw_game_over(self):
-        arcade.draw_text(f"GAME OVER", self.screen_width / 2, self.screen_height - 60, arcade.color.RED, 40,
-                         bold=True, anchor_x='center')
-        arcade.draw_text(f"Score: {self.score}", self.screen_width / 2, self.screen_height / 2 + 34, arcade.color.BLACK,
-                         24, anchor_x='center')
-        arcade.draw_text(f"Recollected cans: {self.cans_recollected}", self.screen_width / 2,
-                         self.screen_height / 2, arcade.color.BLACK, 24, anchor_x='center')
-        arcade.draw_text(f"Steps: {self.steps}", self.screen_width / 2, self.screen_height / 2 - 34,
-                         arcade.color.BLACK, 24, anchor_x='center')
-        arcade.draw_text(f'Press "K" to restart', self.screen_width / 2, 30,
-                         arcade.color.BLACK, 24, anchor_x='center')
+        self.draw_text('game_over', "GAME OVER", self.screen_width / 2, self.screen_height - 60, arcade.color.RED,
+                       40, bold=True, anchor_x='center')
+        self.draw_text('final_score', f"Score: {self.env.score}", self.screen_width / 2,
+                       self.screen_height / 2 + 34, font_size=24, anchor_x='center')
+        self.draw_text('final_cans', f"Recollected cans: {self.env.cans_recollected}", self.screen_width / 2,
+                       self.screen_height / 2, font_size=24, anchor_x='center')
+        self.draw_text('final_steps', f"Steps: {self.env.steps}", self.screen_width / 2,
+                       self.screen_height / 2 - 34, font_size=24, anchor_x='center')
+        self.draw_text('restart', 'Press "K" to restart or "R" to replay', self.screen_width / 2, 30,
+                       font_size=24, anchor_x='center')
+
+    def draw_frame_time(self):
+        """Mean time to draw a frame and frames per second, over the last frames"""
+        if len(self.frame_starts) < 2:
+            return
+        fps = (len(self.frame_starts) - 1) / (self.frame_starts[-1] - self.frame_starts[0])
+        milliseconds = 1000 * sum(self.frame_times) / len(self.frame_times)
+        # Rounded so that the text is not laid out again every frame
+        self.draw_text('frame_time', f"Frame: {milliseconds:.1f} ms. FPS: {fps:.0f}", self.screen_width - 10,
+                       self.screen_height - 20, arcade.color.BLUE, anchor_x='right')
 
     def on_draw(self):
         """
         Render the screen.
         """
+        start_time = time.perf_counter()
         arcade.start_render()
         if not self.game_over:
             self.draw_game()
         else:
             self.draw_game_over()
+        if self.show_frame_time:
+            self.draw_frame_time()
+        self.frame_times.append(time.perf_counter() - start_time)
+        self.frame_starts.append(start_time)
 
-    def update_game(self):
+    def update_game(self, delta_time):
         """
-                Collecting cans
-                """
-        self.can_list.update()
-        if self.change_activated == 1:  # If a move was made
-            self.player_list.update()
-            self.change_activated = 2  # Change updated
-            self.score -= 1
-            self.steps += 1
-
-            # Check for recharge:
-            if arcade.check_for_collision(self.player, self.recharge):
-                self.reset_battery()
-            self.update_battery()
-
-            self.step_time = time.time()
-            if self.dead > 100:
-                self.dead = 0
-
-        elif time.time() - self.step_time > 2:
-            self.steps += 1
-            self.step_time = time.time()
-
-        # Check for recollected cans
-        can_hits = arcade.check_for_collision_with_list(self.player, self.can_list)
-        for can in can_hits:
-            can.kill()
-            self.n_cans -= 1
-            self.cans_recollected += 1
-            self.score += 4
-
-        # Add new cans
-        self.add_new_cans_with_time_check()
-
-        # Check game over
-        if self.steps >= self.max_steps:
-            self.game_over = True
+        Run the clock for the ticks that fit in the time elapsed. The clock lets time pass when no move is made and
+        adds new cans.
+        """
+        # Do not try to catch up after a long pause, e.g. while the window is dragged
+        self.lag = min(self.lag + delta_time, 0.25)
+        while self.lag >= self.clock.tick_seconds and not self.game_over:
+            self.lag -= self.clock.tick_seconds
+            if self.playback is not None:
+                if self.playback.advance(self.playback.tick + 1) and self.playback.dead:
+                    self.dead = 1
+                continue
+            if self.replay_actions is not None:
+                self.pending_action = self.replay_actions.get(self.clock.ticks + 1)
+            elif self.policy is not None and self.clock.ticks - self.clock.last_step >= self.policy_ticks:
+                self.pending_action = self.policy(self.env)
+            self.clock.tick(self.pending_action)
+            if self.pending_action is not None and self.clock.last_step == self.clock.ticks and self.env.dead:
+                self.dead = 1
+            self.pending_action = None
+        if self.dead > 100:
+            self.dead = 0
+        self.sync_sprites()
 
     def update(self, delta_time):
         if self.game_over:
             pass
         else:
-            self.update_game()
-
-    def reset_battery(self):
-        self.battery_state = 'High'
-        self.battery = 60
-
-    def update_battery(self):
-        amount = random.randrange(0, 5)
-        self.battery -= amount
-        if self.battery <= 20:
-            self.battery_state = 'Low'
-        if self.battery <= 0:
-            self.score -= 25
-            self.reset_battery()
-            self.player.center_x = self.recharge.center_x
-            self.player.center_y = self.recharge.center_y
-            self.dead = True
+            self.update_game(delta_time)
 
     def on_key_press(self, key, key_modifiers):
         """
         Called whenever a key on the keyboard is pressed.
         """
-        if not self.game_over:
-            if self.change_activated < 2:  # If key hasn't been released
-                if key == arcade.key.LEFT and self.player.position[0] > self.first_col:
-                    self.player.change_x = -(self.box_height + self.box_margin)
-                    self.change_activated = 1  # Change applied
-                elif key == arcade.key.RIGHT and self.player.position[0] < self.last_col:
-                    self.player.change_x = (self.box_height + self.box_margin)
-                    self.change_activated = 1
-                elif key == arcade.key.UP and self.player.position[1] < self.first_row:
-                    self.player.change_y = (self.box_width + self.box_margin)
-                    self.change_activated = 1
-                elif key == arcade.key.DOWN and self.player.position[1] > self.last_row:
-                    self.player.change_y = -(self.box_width + self.box_margin)
-                    self.change_activated = 1
+        if key == arcade.key.F:
+            self.show_frame_time = not self.show_frame_time
+        elif not self.game_over:
+            action = KEY_ACTIONS.get(key)
+            # Keys must be released before moving again, and are ignored during a replay or while a policy plays.
+            # The move is made on the next tick.
+            if self.replay_actions is None and self.policy is None and self.playback is None and \
+                    self.change_activated == 0 and \
+                    action is not None and self.env.can_move(action):
+                self.pending_action = action
+                self.change_activated = 1
 
         else:
             if key == arcade.key.K:
                 self.setup()
+            elif key == arcade.key.R and self.playback is not None:
+                self.setup()
+            elif key == arcade.key.R:
+                # Watch the game again, with the same moves on the same ticks. It is not recorded twice.
+                self.clock.recorder = None
+                self.replay_actions = dict(self.clock.rewind())
+                self.lag = 0
+                self.dead = 0
+                self.sync_sprites()
 
     def on_key_release(self, key, key_modifiers):
         """
         Called whenever the user lets off a previously pressed key.
         """
-        if key == arcade.key.LEFT or key == arcade.key.RIGHT:
-            self.player.change_x = 0
-        elif key == arcade.key.UP or key == arcade.key.DOWN:
-            self.player.change_y = 0
         self.change_activated = 0  # Key released
 
 
@@ -271,13 +280,31 @@ def new_board(rows, columns):
 
 
 def run_game(row_count=10, column_count=10, width=50, height=50,
-             margin=5, screen_title='Can Collector Robot'):
+             margin=5, screen_title='Can Collector Robot', policy=None, record=None, playback=None,
+             show_frame_time=False):
 
     game = CanCollector(row_count, column_count, width, height,
-                        margin, screen_title)
+                        margin, screen_title, policy=policy, record=record, playback=playback,
+                        show_frame_time=show_frame_time)
     game.setup()
-    arcade.run()
+    try:
+        arcade.run()
+    finally:
+        if game.recorder is not None:
+            game.recorder.close()
+
+
+def play_recording(directory, episode=0, width=50, height=50, margin=5):
+    """Show a game recorded to a folder, e.g. with run_game(record=directory)"""
+    reader = TrajectoryReader(directory)
+    run_game(reader.params['rows'], reader.params['columns'], width, height, margin,
+             f'Can Collector Robot - {directory} game {episode}', playback=reader.replay(episode))
 
 
 if __name__ == "__main__":
-    run_game()
\ No newline at end of file
+    import sys
+    if '--large' in sys.argv:
+        # A 100x100 board with the frame time shown, to check that it keeps the frame rate
+        run_game(100, 100, 6, 6, 1, show_frame_time=True)
+    else:
+        run_game()
\ No newline at end of file
@@ -0,0 +1,207 @@
+'''
+Tabular Q-learning for the can collector robot.
+
+States encode what the robot can see, i.e. whether its cell and each of its 4 neighbours are empty, hold a can or
+are a wall, along with its battery level in BATTERY_LEVELS buckets and where the recharge station is relative to
+it: its direction and its distance in DISTANCE_EDGES buckets.
+Rollouts are played by a pool of processes, each one running a batch of boards in lockstep with an epsilon-greedy
+policy read from a Q-table in shared memory. Their transitions are merged into the table by averaging the temporal
+difference errors of each state and action.
+'''
+
+import time
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from can_collector_env import CanCollectorBatch, UP, DOWN, LEFT, RIGHT, FULL_BATTERY
+
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+BATTERY_LEVELS = 6
+# Upper bounds of the buckets of the distance to the recharge station, the last one being unbounded
+DISTANCE_EDGES = (0, 2, 5, 9)
+# Contents of the 5 visible cells, battery level, 9 directions of the recharge station (4 is being on it) and distance
+N_STATES = 3 ** 5 * BATTERY_LEVELS * 9 * (len(DISTANCE_EDGES) + 1)
+
+_worker = {}
+
+
+def encode_state(observation, battery, position, recharge, columns):
+    """
+    State of a robot. Works on single values or on arrays with a value per board.
+    :param observation: observation of the environment, see CanCollectorEnv.observe.
+    :param battery: battery left.
+    :param position: cell of the robot.
+    :param recharge: cell of the recharge station.
+    :param columns: number of columns of the board.
+    :return: state index, lower than N_STATES.
+    """
+    level = np.minimum(np.maximum(battery - 1, 0) * BATTERY_LEVELS // FULL_BATTERY, BATTERY_LEVELS - 1)
+    row, column = np.divmod(position, columns)
+    recharge_row, recharge_column = np.divmod(recharge, columns)
+    direction = 3 * (np.sign(recharge_row - row) + 1) + np.sign(recharge_column - column) + 1
+    distance = np.searchsorted(DISTANCE_EDGES, np.abs(recharge_row - row) + np.abs(recharge_column - column))
+    return observation % 3 ** 5 + 3 ** 5 * (level + BATTERY_LEVELS * (direction + 9 * distance))
+
+
+def _batch_states(batch, observations):
+    return encode_state(observations, batch.battery, batch.position, batch.recharge, batch.columns)
+
+
+def rollout(q, n_boards, epsilon, seed, rows=10, columns=10, max_steps=200):
+    """
+    Play one game on each board of a batch following an epsilon-greedy policy.
+    :param q: Q-table of shape (N_STATES, len(ACTIONS)).
+    :param n_boards: number of boards.
+    :param epsilon: probability of taking a random action.
+    :param seed: seed of the boards and of the exploration.
+    :param rows: number of rows of each board.
+    :param columns: number of columns of each board.
+    :param max_steps: number of steps of a game.
+    :return: arrays with the state, action, reward and next state of every transition, and the final scores.
+    """
+    rng = np.random.default_rng(seed)
+    batch = CanCollectorBatch(n_boards, rows, columns, max_steps=max_steps, seed=rng.integers(2 ** 63, size=n_boards))
+    states = _batch_states(batch, batch.reset())
+
+    transitions = np.empty((4, max_steps, n_boards), dtype=np.int32)
+    for step in range(max_steps):
+        actions = np.where(rng.random(n_boards) < epsilon, rng.integers(len(ACTIONS), size=n_boards),
+                           np.argmax(q[states], axis=1))
+        observations, rewards, _ = batch.step(np.asarray(ACTIONS)[actions])
+        next_states = _batch_states(batch, observations)
+        transitions[:, step] = states, actions, rewards, next_states
+        states = next_states
+    return transitions.reshape(4, -1), batch.final_score.copy()
+
+
+def update_q(q, transitions, alpha=0.2, gamma=0.97, terminal=None):
+    """
+    Move the Q-value of each visited state and action towards the mean of its temporal difference targets.
+    :param q: Q-table, updated in place.
+    :param transitions: array of shape (4, n) with the state, action, reward and next state of each transition.
+    :param alpha: learning rate.
+    :param gamma: discount of the next state's value.
+    :param terminal: boolean array marking the transitions which end a game, whose next state is not bootstrapped.
+    :return: Q-table.
+    """
+    states, actions, rewards, next_states = transitions
+    future = q[next_states].max(axis=1)
+    if terminal is not None:
+        future = np.where(terminal, 0, future)
+    errors = rewards + gamma * future - q[states, actions]
+
+    # Transitions of the same state and action add up their errors, which are then averaged
+    index = states * q.shape[1] + actions
+    counts = np.bincount(index, minlength=q.size)
+    sums = np.bincount(index, weights=errors, minlength=q.size)
+    visited = counts > 0
+    q.reshape(-1)[visited] += alpha * sums[visited] / counts[visited]
+    return q
+
+
+def _init_rollout_worker(shm_name, shape):
+    """Attach the worker to the shared Q-table"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['q'] = np.ndarray(shape, dtype=float, buffer=shm.buf)
+
+
+def _rollout(args):
+    return rollout(_worker['q'], *args)
+
+
+def train(rounds=300, workers=1, boards_per_worker=256, alpha=0.2, gamma=0.97, epsilon=(0.2, 0.01), seed=0, q=None,
+          rows=10, columns=10, max_steps=200, verbose=10):
+    """
+    Learn a Q-table for the can collector.
+    :param rounds: number of rounds. In each one, every worker plays a game on each of its boards.
+    :param workers: number of processes playing the games.
+    :param boards_per_worker: number of boards each worker plays at once.
+    :param alpha: learning rate.
+    :param gamma: discount of the next state's value.
+    :param epsilon: exploration probability of the first and last rounds, decayed geometrically in between.
+    :param seed: seed of the games.
+    :param q: Q-table to start from. Zeros by default.
+    :param rows: number of rows of each board.
+    :param columns: number of columns of each board.
+    :param max_steps: number of steps of a game.
+    :param verbose: print the progress every this many rounds.
+    :return: Q-table and array with the mean final score of each round.
+    """
+    if workers < 1:
+        raise ValueError('workers must be at least 1.')
+    q = np.zeros((N_STATES, len(ACTIONS))) if q is None else np.array(q, dtype=float)
+    epsilons = np.geomspace(epsilon[0], epsilon[1], rounds)
+    seeds = np.random.SeedSequence(seed).generate_state(rounds * workers).reshape(rounds, workers)
+
+    # Games end together after max_steps, so the last step of each board is terminal
+    terminal = np.zeros((max_steps, boards_per_worker * workers), dtype=bool)
+    terminal[-1] = True
+    terminal = terminal.ravel()
+
+    # Workers read the Q-table from shared memory, so only the rollout parameters are sent with each task
+    pool = shm = None
+    if workers > 1:
+        shm = shared_memory.SharedMemory(create=True, size=q.nbytes)
+        shared_q = np.ndarray(q.shape, dtype=float, buffer=shm.buf)
+        shared_q[:] = q
+        q = shared_q
+        pool = Pool(workers, initializer=_init_rollout_worker, initargs=(shm.name, q.shape))
+
+    scores = np.zeros(rounds)
+    start_time = time.perf_counter()
+    try:
+        for r in range(rounds):
+            tasks = [(boards_per_worker, epsilons[r], seeds[r, w], rows, columns, max_steps) for w in range(workers)]
+            results = pool.map(_rollout, tasks) if pool is not None else [rollout(q, *task) for task in tasks]
+
+            # Transitions are ordered by step and then board, so join the workers' boards step by step
+            transitions = np.concatenate([t.reshape(4, max_steps, -1) for t, _ in results], axis=2).reshape(4, -1)
+            update_q(q, transitions, alpha, gamma, terminal)
+            scores[r] = np.concatenate([s for _, s in results]).mean()
+
+            if verbose and (r + 1) % verbose == 0:
+                seconds = time.perf_counter() - start_time
+                print(f'Round {r + 1}. Mean score: {scores[r]:.1f}. Epsilon: {epsilons[r]:.3f}. '
+                      f'Episodes/sec: {(r + 1) * workers * boards_per_worker / seconds:.0f}')
+        q = np.array(q)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            shm.close()
+            shm.unlink()
+
+    seconds = time.perf_counter() - start_time
+    if verbose:
+        print(f'Trained on {rounds * workers * boards_per_worker} episodes in {seconds:.1f}s '
+              f'({rounds * workers * boards_per_worker / seconds:.0f} episodes/sec)')
+    return q, scores
+
+
+def evaluate(q, n_boards=1000, seed=1, rows=10, columns=10, max_steps=200):
+    """Mean final score of the greedy policy of a Q-table"""
+    return rollout(q, n_boards, 0, seed, rows, columns, max_steps)[1].mean()
+
+
+class QPolicy:
+    """
+    Greedy policy of a Q-table, to play a CanCollectorEnv, e.g. in the CanCollector window.
+    Moves against a wall are never chosen, since the game ignores them.
+    """
+    def __init__(self, q):
+        self.q = q
+
+    def __call__(self, env):
+        state = encode_state(env.observe(), env.battery, env.position, env.recharge, env.columns)
+        values = [self.q[state, a] if env.can_move(action) else -np.inf for a, action in enumerate(ACTIONS)]
+        return ACTIONS[int(np.argmax(values))]
+
+
+if __name__ == '__main__':
+    q, scores = train(workers=4)
+    np.save('can_collector_q.npy', q)
+    print(f'Greedy policy mean score: {evaluate(q):.1f}')
+
+    # Watch the learned policy play
+    from can_collector_framework import run_game
+    run_game(policy=QPolicy(q))
@@ -0,0 +1,294 @@
+'''
+Recording of can collector games to disk, and their replay.
+
+A recording is a folder with the parameters of the board in params.json and every event of the games in
+records.npy, a structured array of RECORD_DTYPE. Each game starts with a RESET record, with the cell of the robot and
+the recharge station, followed by a CAN record for each initial can. Then there is a STEP record after every step,
+with the state of the robot and the cell of the can picked up, if any, and a CAN record for every new can.
+Records are appended in chunks, and the header of the file is rewritten after each chunk, so a recording is
+always readable, even while it is written or after a crash. Recordings are read memory-mapped, a chunk at a time.
+'''
+
+import os
+import json
+import numpy as np
+from can_collector_env import FULL_BATTERY, LOW_BATTERY
+
+RESET, STEP, CAN = range(3)
+RECORD_DTYPE = np.dtype([('episode', '<u4'), ('tick', '<u4'), ('kind', 'u1'), ('action', 'i1'), ('battery', 'i1'),
+                         ('dead', '?'), ('position', '<u4'), ('score', '<i4'), ('cell', '<i4')])
+
+# Number of records written or read at once
+CHUNK_SIZE = 4096
+# Bytes reserved for the header of records.npy, so that it can be rewritten in place as the file grows
+HEADER_SIZE = 256
+
+
+def _npy_header(n_records):
+    header = "{{'descr': {}, 'fortran_order': False, 'shape': ({},), }}".format(
+        np.lib.format.dtype_to_descr(RECORD_DTYPE), n_records)
+    # Magic string, version 1.0 and the length of the header, which is padded with spaces and ends with a newline
+    header = header.ljust(HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1')
+
+
+class TrajectoryRecorder:
+    """
+    Records every game played on an environment.
+    :param directory: folder where the recording is written. It is created if it does not exist.
+    :param env: CanCollectorEnv to record. Call reset after each reset of the environment and record after every
+    step or new can, e.g. by passing the recorder to a GameClock. The recorder is told of every new can through the
+    environment's on_can_added, and a GameClock only sets it while recording, so that cans of the games it does
+    not record, e.g. replays, are not kept.
+    :param chunk_size: number of records written at once.
+    """
+    def __init__(self, directory, env, chunk_size=CHUNK_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'params.json'), 'w') as f:
+            json.dump({'rows': env.rows, 'columns': env.columns, 'max_cans': env.max_cans,
+                       'max_steps': env.max_steps}, f, sort_keys=True)
+
+        self.env = env
+        self.episode = -1
+        self.n_records = 0
+        self._chunk = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self._n_chunk = 0
+        self._new_cans = []
+        self._cans_recollected = 0
+        self._file = open(os.path.join(directory, 'records.npy'), 'wb')
+        self._file.write(_npy_header(0))
+        env.on_can_added = self.add_can
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def reset(self, tick=0):
+        """Record the start of a game, after the environment is reset"""
+        self.episode += 1
+        self._cans_recollected = 0
+        self._append(tick, RESET, -1, -1)
+        self._append_cans(tick)
+
+    def record(self, tick, action=None):
+        """
+        Record what happened in a tick.
+        :param tick: tick, or step if the game is not run by a clock.
+        :param action: action of the step made, if any.
+        """
+        if action is not None:
+            env = self.env
+            picked = env.position if env.cans_recollected > self._cans_recollected else -1
+            self._cans_recollected = env.cans_recollected
+            self._append(tick, STEP, action, picked)
+        self._append_cans(tick)
+
+    def add_can(self, cell):
+        """Keep a new can until the next call to reset or record"""
+        self._new_cans.append(cell)
+
+    def step(self, action):
+        """Step the environment and record it, using the number of steps as the tick"""
+        result = self.env.step(action)
+        self.record(self.env.steps, action)
+        return result
+
+    def flush(self):
+        """Write the records kept in memory and update the header"""
+        if self._n_chunk:
+            self._chunk[:self._n_chunk].tofile(self._file)
+            self.n_records += self._n_chunk
+            self._n_chunk = 0
+            self._file.seek(0)
+            self._file.write(_npy_header(self.n_records))
+            self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        if self.env.on_can_added == self.add_can:
+            self.env.on_can_added = None
+
+    def _append(self, tick, kind, action, cell):
+        env = self.env
+        record = self._chunk[self._n_chunk]
+        record['episode'] = self.episode
+        record['tick'] = tick
+        record['kind'] = kind
+        record['action'] = action
+        record['battery'] = env.battery
+        record['dead'] = env.dead
+        record['position'] = env.position
+        record['score'] = env.score
+        record['cell'] = cell
+        self._n_chunk += 1
+        if self._n_chunk == len(self._chunk):
+            self.flush()
+
+    def _append_cans(self, tick):
+        for cell in self._new_cans:
+            self._append(tick, CAN, -1, cell)
+        self._new_cans.clear()
+
+
+class TrajectoryReader:
+    """
+    Memory-mapped recording.
+    :param directory: folder of the recording.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'params.json')) as f:
+            self.params = json.load(f)
+        self.records = np.load(os.path.join(directory, 'records.npy'), mmap_mode='r')
+        self._starts = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Iterate over the records, a chunk at a time"""
+        for start in range(0, len(self.records), chunk_size):
+            yield self.records[start:start+chunk_size]
+
+    @property
+    def episode_starts(self):
+        """Index of the first record of each game, found by streaming the kind of every record"""
+        if self._starts is None:
+            self._starts = np.concatenate([start + np.flatnonzero(chunk['kind'] == RESET) for start, chunk in
+                                           zip(range(0, len(self.records), CHUNK_SIZE), self.chunks())] +
+                                          [np.zeros(0, dtype=int)])
+        return self._starts
+
+    def episode(self, i):
+        """Records of a game"""
+        starts = self.episode_starts
+        end = starts[i+1] if i + 1 < len(starts) else len(self.records)
+        return self.records[starts[i]:end]
+
+    def replay(self, i):
+        """BoardReplay of a game"""
+        return BoardReplay(self.episode(i), self.params['rows'], self.params['columns'], self.params['max_steps'])
+
+
+class BoardReplay:
+    """
+    Board rebuilt from the records of a game, one tick at a time. It has the attributes of a CanCollectorEnv used to
+    show a game, so it may be drawn by the CanCollector window.
+    :param records: records of a game, starting with its RESET record.
+    :param rows: number of rows of the board.
+    :param columns: number of columns of the board.
+    :param max_steps: number of steps of a game.
+    """
+    def __init__(self, records, rows, columns, max_steps):
+        if not len(records) or records[0]['kind'] != RESET:
+            raise ValueError('A game must start with a RESET record.')
+        self.records = records
+        self.rows = rows
+        self.columns = columns
+        self.max_steps = max_steps
+        self.recharge = int(records[0]['position'])
+        self.position = None
+        self.cans = None
+        self.n_cans = 0
+        self.cans_recollected = 0
+        self.battery = 0
+        self.score = 0
+        self.steps = 0
+        self.dead = False
+        self.tick = 0
+        self._next = 0
+        self.reset()
+
+    def reset(self):
+        """Go back to the start of the game"""
+        self.position = self.recharge
+        self.cans = np.zeros(self.rows * self.columns, dtype=bool)
+        self.n_cans = 0
+        self.cans_recollected = 0
+        self.battery = FULL_BATTERY
+        self.score = 0
+        self.steps = 0
+        self.dead = False
+        self._next = 0
+        self.advance(0)
+
+    @property
+    def battery_state(self):
+        return 'Low' if self.battery <= LOW_BATTERY else 'High'
+
+    @property
+    def done(self):
+        return self._next == len(self.records)
+
+    def cell(self, position):
+        """Row and column of a cell"""
+        return divmod(position, self.columns)
+
+    def advance(self, tick=None):
+        """
+        Apply the records up to a tick.
+        :param tick: last tick to apply. The next tick with records by default.
+        :return: number of records applied.
+        """
+        if self.done:
+            return 0
+        tick = int(self.records[self._next]['tick']) if tick is None else tick
+        start = self._next
+        # Read the records in chunks, so that long games are not loaded at once
+        while not self.done:
+            chunk = np.asarray(self.records[self._next:self._next+CHUNK_SIZE])
+            n = int(np.searchsorted(chunk['tick'], tick, side='right'))
+            for record in chunk[:n]:
+                self._apply(record)
+            self._next += n
+            if n < len(chunk):
+                break
+        self.tick = tick
+        return self._next - start
+
+    def _apply(self, record):
+        if record['kind'] == CAN:
+            self.cans[record['cell']] = True
+            self.n_cans += 1
+        elif record['kind'] == STEP:
+            self.steps += 1
+            self.position = int(record['position'])
+            self.battery = int(record['battery'])
+            self.score = int(record['score'])
+            self.dead = bool(record['dead'])
+            if record['cell'] >= 0:
+                self.cans[record['cell']] = False
+                self.n_cans -= 1
+                self.cans_recollected += 1
+
+
+if __name__ == '__main__':
+    # Record games played with a clock, replaying one of them unrecorded before restarting, as the game window does
+    import tempfile
+    from can_collector_env import CanCollectorEnv, GameClock
+
+    env = CanCollectorEnv(spawn_interval=None, seed=0)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        with TrajectoryRecorder(directory, env) as recorder:
+            clock = GameClock(env, recorder=recorder)
+            for game in range(3):
+                clock.recorder = recorder
+                clock.reset()
+                clock.fast_forward(policy=lambda env, tick: int(rng.integers(4)) if tick % 30 == 0 else None)
+                final_state = env.position, env.score, env.cans.copy()
+                clock.recorder = None
+                clock.replay()
+
+        reader = TrajectoryReader(directory)
+        for game in range(3):
+            records = reader.episode(game)
+            initial_cans = ((records['kind'] == CAN) & (records['tick'] == 0)).sum()
+            assert initial_cans == env.initial_cans, f'Game {game} starts with {initial_cans} cans'
+        replay = reader.replay(2)
+        replay.advance(np.iinfo(np.uint32).max)
+        assert (replay.position, replay.score) == final_state[:2] and (replay.cans == final_state[2]).all()
+        print(f'{len(reader)} records of 3 games read back as played')
@@ -0,0 +1,155 @@
+"""
+Benchmarks of the dynamic programming solvers over a ladder of problem sizes.
+
+Each case records the wall time, the number of sweeps and backups, the backups per second and the peak memory
+allocated while solving it. Results are written as JSON and compared with a stored baseline, so that a change
+making a solver slower, hungrier or doing more backups than the tolerance allows is flagged as a regression.
+Wall times are the best of a few repeats, and memory is measured in a separate run since tracing it slows
+the solvers down.
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tracemalloc
+import contextlib
+import numpy as np
+from gridworld_policy_evaluation import iterative_state_evaluation
+from gamblers_problem import gamble
+from jacks_rental import optimise_rental
+
+# Problem size of each case: side of the grid, goal of the gambler and stock limit of each rental location
+LADDERS = {'gridworld': (10, 25, 50, 100, 200),
+           'gambler': (100, 1000, 5000, 10000),
+           'rental': (10, 20, 40, 80)}
+
+SOLVERS = {
+    'gridworld': lambda size, stats: iterative_state_evaluation(gamma=0.9, policy='random', world_size=size, verbose=0,
+                                                                stats=stats),
+    'gambler': lambda size, stats: gamble(0.4, size, tolerance=1e-6, stats=stats, verbose=False),
+    'rental': lambda size, stats: optimise_rental(n_free=1, n_max_storage=size // 2, stock_limit=size, verbose=False,
+                                                  stats=stats),
+}
+
+BASELINE_PATH = 'dp_benchmarks_baseline.json'
+RESULTS_PATH = 'dp_benchmarks.json'
+
+
+def benchmark(solver, size, repeats=3, memory=True):
+    """
+    Solve a problem and measure it.
+    :param solver: name of the solver, one of SOLVERS.
+    :param size: size of the problem, see LADDERS.
+    :param repeats: number of timed runs. The fastest one is kept.
+    :param memory: whether to do an extra run measuring the peak memory.
+    :return: dict with the measures of the case.
+    """
+    if solver not in SOLVERS:
+        raise NotImplementedError('Solver "{}" has not been implemented.'.format(solver))
+    if repeats < 1:
+        raise ValueError('repeats must be at least 1.')
+
+    seconds = np.inf
+    for _ in range(repeats):
+        stats = {'iterations': 0, 'sweeps': 0, 'backups': 0}
+        # Solvers report their progress by printing it, which is not wanted here
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            SOLVERS[solver](size, stats)
+            seconds = min(seconds, time.perf_counter() - start_time)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                SOLVERS[solver](size, {'iterations': 0, 'sweeps': 0, 'backups': 0})
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+
+    return {'solver': solver,
+            'size': size,
+            'seconds': seconds,
+            'iterations': stats['iterations'],
+            'sweeps': stats['sweeps'],
+            'backups': stats['backups'],
+            'backups_per_second': stats['backups'] / seconds if seconds > 0 else None,
+            'peak_mb': peak_mb}
+
+
+def run(ladders=LADDERS, repeats=3, memory=True):
+    """Benchmark every size in the ladder of each solver and print a table"""
+    results = []
+    print('{:>10} {:>7} {:>9} {:>6} {:>8} {:>11} {:>13} {:>9}'.format('solver', 'size', 'seconds', 'iters', 'sweeps',
+                                                                     'backups', 'backups/sec', 'peak MB'))
+    for solver, sizes in ladders.items():
+        for size in sizes:
+            result = benchmark(solver, size, repeats, memory)
+            results.append(result)
+            speed = '-' if not result['backups_per_second'] else '{:.3g}'.format(result['backups_per_second'])
+            peak = '-' if result['peak_mb'] is None else '{:.1f}'.format(result['peak_mb'])
+            print('{solver:>10} {size:>7} {seconds:>9.3f} {iterations:>6} {sweeps:>8} {backups:>11} '
+                  '{:>13} {:>9}'.format(speed, peak, **result))
+    return results
+
+
+def save(results, path):
+    """Write the results as JSON, along with the versions they were measured with"""
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'machine': platform.machine(),
+                   'results': results}, f, indent=2)
+
+
+def load(path):
+    """Read the results written by save"""
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.1, backups_tolerance=0., min_seconds=0.05):
+    """
+    Compare results with a baseline. Cases missing from either of them are ignored.
+    :param results: list of results from run.
+    :param baseline: list of results from run, e.g. read with load.
+    :param time_tolerance: fraction by which a case may be slower than in the baseline.
+    :param memory_tolerance: fraction by which the peak memory of a case may grow.
+    :param backups_tolerance: fraction by which the number of backups of a case may grow.
+    :param min_seconds: cases are never flagged as slower for less than this, since short runs are noisy.
+    :return: list with a description of each regression.
+    """
+    reference = {(result['solver'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get((result['solver'], result['size']))
+        if base is None:
+            continue
+        for measure, tolerance in (('seconds', time_tolerance), ('peak_mb', memory_tolerance),
+                                   ('backups', backups_tolerance)):
+            if result[measure] is None or base[measure] is None:
+                continue
+            slack = min_seconds if measure == 'seconds' else 0
+            if result[measure] > base[measure] * (1 + tolerance) + slack:
+                regressions.append('{} (size {}): {} went from {:.4g} to {:.4g}'.format(
+                    result['solver'], result['size'], measure, base[measure], result[measure]))
+    return regressions
+
+
+if __name__ == '__main__':
+    results = run()
+    save(results, RESULTS_PATH)
+
+    if not os.path.exists(BASELINE_PATH):
+        save(results, BASELINE_PATH)
+        print(f'\nNo baseline found, results stored as the baseline in {BASELINE_PATH}')
+    else:
+        regressions = compare(results, load(BASELINE_PATH))
+        if regressions:
+            print('\nRegressions against the baseline:')
+            print('\n'.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions against the baseline')
@@ -6,22 +6,50 @@ luisdanield@gmail.com
 This is an implementation of value iteration for finding a tabular solution.
 
 A gambler is offered unlimited coin flips with a coin with probability p of success.
-Its objective is to reach 100$.
+Its objective is to reach a goal, 100$ in the book.
 He sets the value of his bets. If he looses then the bet amount is lost, otherwise he doubles his money.
 Find an optimal solution given the capital he has.
+
+The value and policy of capital c are stored at index c-1, for c from 1 to goal-1. Stakes larger than
+min(c, goal-c) are never considered, since overshooting the goal can only lose more money.
 """
 
+from multiprocessing import Pool
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+from solution_cache import cached_solve
+from backup_scheduler import get_scheduler
+from tabular_mdp import TabularMDP, add_counts, policy_iteration
+
+# Stakes only replace the current one when they are better by more than this, so that rounding errors among
+# equally good stakes do not keep changing the policy
+TIE_TOLERANCE = 1e-12
+# Goals up to this one are solved as a TabularMDP, whose size grows with goal^2
+MDP_MAX_GOAL = 1000
+# Stakes evaluated per NumPy call by the pruned search of best_stakes
+STAKE_BLOCK = 64
+# Blocks where more than 1/STAKE_BLOCK_DENSITY of the capitals survive pruning are walked one stake at a time
+STAKE_BLOCK_DENSITY = 8
 
 
-def expected_return(state, action, state_value, p):
+def expected_return(state, action, state_value, p, goal=100):
+    """
+    Expected return of betting a stake with a given capital.
+    :param state: capital.
+    :param action: stake.
+    :param state_value: state value array.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: probability of reaching the goal.
+    """
     reward = 0
     next_state_value = 0
 
     # Evaluate positive case
     new_state_positive = state + action
-    if new_state_positive >= 100:
+    if new_state_positive >= goal:
         reward = p
     else:
         idx = int(new_state_positive - 1)
@@ -36,53 +64,363 @@ def expected_return(state, action, state_value, p):
     return reward + next_state_value
 
 
-def gamble(p, goal, tolerance=1e-1):
-    actions = np.linspace(1, goal-1, goal-1)
-    policy = np.ones_like(actions, dtype=int)
-    state_value = np.zeros_like(actions)
+def _capital_values(state_value):
+    """Values indexed by capital, from 0 (lost) to goal (won), along the last axis"""
+    edge = np.ones(state_value.shape[:-1] + (1,))
+    return np.concatenate((0 * edge, state_value, edge), axis=-1)
+
+
+def policy_return(state_value, policy, p, goal):
+    """
+    Expected return of following a policy from every capital at once. Arrays may have leading batch axes,
+    in which case p must broadcast against them (e.g. shape (n, 1)).
+    :param state_value: state value array.
+    :param policy: array with the stake of each capital.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: array with the expected return of each capital.
+    """
+    values = _capital_values(state_value)
+    capitals = np.arange(1, goal)
+    win = np.broadcast_to(np.minimum(capitals + policy, goal), state_value.shape)
+    lose = np.broadcast_to(np.maximum(capitals - policy, 0), state_value.shape)
+    return p * np.take_along_axis(values, win, axis=-1) + (1-p) * np.take_along_axis(values, lose, axis=-1)
+
+
+def _block_best_stakes(values, p, goal):
+    """
+    Branch and bound version of best_stakes for a single value array and p < 0.5.
+    Stakes are taken STAKE_BLOCK at a time. With m the running maximum of the values, no stake of a block returns
+    more than p * m(c + last stake) + (1-p) * m(c - first stake), so every capital whose bound is below its best
+    return so far, or below the return of betting everything it can, skips the whole block. The remaining capitals
+    gather the block as a (capital, stake) matrix in one call, unless they are too many to beat walking its
+    diagonals. Ties are still broken in favour of the smallest stake.
+    :param values: state value array indexed by capital, from 0 to goal.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: array with the expected return of the best stake and array with the best stake of each capital.
+    """
+    # Zero padding lets the last block read past the goal and before capital 0
+    win_values = np.concatenate((p * values, np.zeros(STAKE_BLOCK)))
+    lose_values = np.concatenate((np.zeros(STAKE_BLOCK), (1-p) * values))
+    max_values = np.maximum.accumulate(values)
+    best_return = np.full(goal - 1, -np.inf)
+    best_stake = np.ones(goal - 1, dtype=int)
+    diagonal_return = np.empty(goal - 1)
+    diagonal_better = np.empty(goal - 1, dtype=bool)
+    block_stakes = np.arange(STAKE_BLOCK)
+    capitals = np.arange(1, goal)
+    max_stake = np.minimum(capitals, goal - capitals)
+    bold_return = win_values[capitals + max_stake] + lose_values[STAKE_BLOCK + capitals - max_stake]
+    for first_stake in range(1, goal // 2 + 1, STAKE_BLOCK):
+        capitals = np.arange(first_stake, goal - first_stake + 1)
+        bound = (p * max_values[np.minimum(capitals + first_stake + STAKE_BLOCK - 1, goal)]
+                 + (1-p) * max_values[capitals - first_stake])
+        keep = (bound >= best_return[capitals - 1]) & (bound >= bold_return[capitals - 1])
+        n_keep = np.count_nonzero(keep)
+        if not n_keep:
+            continue
+        if n_keep > len(capitals) // STAKE_BLOCK_DENSITY:
+            for stake in range(first_stake, min(first_stake + STAKE_BLOCK, goal // 2 + 1)):
+                n = goal - 2*stake + 1
+                np.add(win_values[2*stake:goal+1], lose_values[STAKE_BLOCK:STAKE_BLOCK+n], out=diagonal_return[:n])
+                best = best_return[stake-1:goal-stake]
+                np.greater(diagonal_return[:n], best, out=diagonal_better[:n])
+                np.copyto(best, diagonal_return[:n], where=diagonal_better[:n])
+                np.copyto(best_stake[stake-1:goal-stake], stake, where=diagonal_better[:n])
+            continue
+        capitals = capitals[keep]
+        stakes = first_stake + block_stakes
+        stake_return = (win_values[capitals[:, None] + stakes]
+                        + lose_values[STAKE_BLOCK + capitals[:, None] - stakes])
+        stake_return[stakes > max_stake[capitals - 1, None]] = -np.inf
+        stake = stake_return.argmax(axis=1)
+        stake_return = stake_return[np.arange(len(capitals)), stake]
+        better = stake_return > best_return[capitals - 1]
+        best_return[capitals[better] - 1] = stake_return[better]
+        best_stake[capitals[better] - 1] = first_stake + stake[better]
+
+    return best_return, best_stake
+
+
+def best_stakes(state_value, p, goal):
+    """
+    Evaluate the masked capital x stake matrix and select the best stake of each capital. Ties are broken in
+    favour of the smallest stake.
+    A single value array with p < 0.5 is searched in pruned blocks of stakes, see _block_best_stakes.
+    Otherwise the matrix is walked one stake (diagonal) at a time. Each of them is a pair of contiguous slices of the
+    values, so the work is vectorised over capitals, and over any leading batch axes, without ever allocating goal^2
+    elements.
+    :param state_value: state value array.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: array with the expected return of the best stake and array with the best stake of each capital.
+    """
+    values = _capital_values(state_value)
+    if state_value.ndim == 1 and np.ndim(p) == 0 and p < 0.5:
+        return _block_best_stakes(values, p, goal)
+
+    win_values = p * values
+    lose_values = (1-p) * values
+    best_return = np.full(state_value.shape, -np.inf)
+    best_stake = np.ones(state_value.shape, dtype=int)
+    stake_return = np.empty(state_value.shape)
+    better = np.empty(state_value.shape, dtype=bool)
+    for stake in range(1, goal // 2 + 1):
+        # Only capitals from stake to goal-stake may bet it
+        n = goal - 2*stake + 1
+        np.add(win_values[..., 2*stake:goal+1], lose_values[..., :n], out=stake_return[..., :n])
+        best = best_return[..., stake-1:goal-stake]
+        np.greater(stake_return[..., :n], best, out=better[..., :n])
+        np.copyto(best, stake_return[..., :n], where=better[..., :n])
+        np.copyto(best_stake[..., stake-1:goal-stake], stake, where=better[..., :n])
+
+    return best_return, best_stake
+
+
+def improve_policy(state_value, policy, p, goal):
+    """
+    Greedy policy with respect to the state values. Current stakes are kept unless another one is clearly better.
+    :return: improved policy array.
+    """
+    best_return, best_stake = best_stakes(state_value, p, goal)
+    better = best_return > policy_return(state_value, policy, p, goal) + TIE_TOLERANCE
+    return np.where(better, best_stake, policy)
+
+
+def solve_policy_value(policy, p, goal):
+    """
+    Evaluate a policy exactly by solving (I - P) v = r, where P only has a win and a loss transition per capital.
+    :param policy: array with the stake of each capital.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: state value array.
+    """
+    capitals = np.arange(1, goal)
+    win = np.minimum(capitals + policy, goal)
+    lose = np.maximum(capitals - policy, 0)
+
+    # Reaching the goal pays p and losing everything pays nothing, neither of them has a next state
+    rows = np.concatenate((capitals[win < goal], capitals[lose > 0])) - 1
+    cols = np.concatenate((win[win < goal], lose[lose > 0])) - 1
+    probas = np.concatenate((np.full((win < goal).sum(), p), np.full((lose > 0).sum(), 1-p)))
+    transition = sparse.csr_matrix((probas, (rows, cols)), shape=(goal - 1, goal - 1))
+    system = sparse.identity(goal - 1, format='csr') - transition
+    return spsolve(system.tocsc(), p * (win == goal))
+
+
+def gambler_mdp(p, goal):
+    """
+    Compile the gambler's problem into a TabularMDP. Action a is a stake of a+1 and reaching the goal rewards 1.
+    Its size grows with goal^2, so use gamble for large goals.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :return: TabularMDP.
+    """
+    n_states = goal - 1
+    stakes, capitals = np.meshgrid(np.arange(1, goal // 2 + 1), np.arange(1, goal), indexing='ij')
+    legal = stakes <= np.minimum(capitals, goal - capitals)
+    row = (stakes - 1) * n_states + capitals - 1
+    win = legal & (capitals + stakes < goal)
+    lose = legal & (capitals - stakes > 0)
+
+    rows = np.concatenate((row[win], row[lose]))
+    cols = np.concatenate((capitals[win] + stakes[win], capitals[lose] - stakes[lose])) - 1
+    probas = np.concatenate((np.full(win.sum(), p), np.full(lose.sum(), 1 - p)))
+    transitions = sparse.csr_matrix((probas, (rows, cols)), shape=(legal.size, n_states))
+    rewards = np.where(legal & (capitals + stakes >= goal), p, 0.)
+
+    return TabularMDP(transitions, rewards, 1., legal)
+
+
+def scheduled_gamble(p, goal, state_value, scheduler, verbose=True):
+    """
+    Value iteration where a scheduler decides which capital is backed up next.
+    """
+    def backup(state, values):
+        capital = state + 1
+        return max(expected_return(capital, action, values, p, goal)
+                   for action in range(1, min(capital, goal - capital) + 1))
+
+    # A capital's value depends on every capital it may reach with any stake
+    rows, cols = [], []
+    for capital in range(1, goal):
+        reachable = np.arange(1, min(capital, goal - capital) + 1)
+        reachable = np.concatenate((capital + reachable[capital + reachable < goal],
+                                    capital - reachable[capital - reachable > 0]))
+        rows.append(np.full(len(reachable), capital - 1))
+        cols.append(reachable - 1)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    dependencies = sparse.csr_matrix((np.full(len(rows), max(p, 1 - p)), (rows, cols)),
+                                     shape=(goal - 1, goal - 1))
+
+    state_value = scheduler.run(state_value, backup, dependencies=dependencies)
+    if verbose:
+        print(f'Backups ({scheduler.strategy}): {scheduler.backups}')
+
+    _, policy = best_stakes(state_value, p, goal)
+    return policy, state_value
+
+
+def gamble(p, goal, tolerance=1e-1, warm_start=None, cache=None, scheduler=None, evaluation='sweep', stats=None,
+           verbose=True):
+    """
+    Find the optimal policy of the gambler's problem.
+    :param p: probability of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :param tolerance: max change of the state values to consider them converged.
+    :param warm_start: tuple with the policy and state value arrays to start from.
+    :param cache: SolutionCache or directory where solutions are stored. Solved problems are read from it and
+    unsolved ones start from the closest cached solution.
+    :param scheduler: BackupScheduler or name of its strategy. If given, values are found by value iteration
+    backing up one state at a time in the order decided by the scheduler, and the policy is extracted at the end.
+    :param evaluation: 'sweep' does a single sweep of the current policy before improving it, 'direct' evaluates it
+    exactly. Each improvement takes goal^2/4 operations, so 'direct' is much faster with large goals.
+    :param stats: dict where iterations, sweeps and backups are counted, see tabular_mdp. Cached solutions count none.
+    :param verbose: whether to print the progress of each iteration.
+    :return: policy and state value arrays.
+
+    Goals up to MDP_MAX_GOAL are compiled with gambler_mdp and solved by tabular_mdp.policy_iteration, larger ones
+    back up the stakes of every capital at once without building the transitions.
+    """
+    if evaluation not in ('sweep', 'direct'):
+        raise NotImplementedError('Evaluation "{}" has not been implemented.'.format(evaluation))
+    if cache is not None:
+        return cached_solve(cache, 'gamble', {'p': float(p), 'goal': int(goal), 'tolerance': float(tolerance)},
+                            lambda warm: gamble(p, goal, tolerance, warm, scheduler=scheduler, evaluation=evaluation,
+                                                stats=stats, verbose=verbose),
+                            same=('goal',))
+
+    if warm_start is None:
+        policy = np.ones(goal - 1, dtype=int)
+        state_value = np.zeros(goal - 1)
+    else:
+        policy = np.array(warm_start[0], dtype=int)
+        state_value = np.array(warm_start[1], dtype=float)
+        if policy.shape != (goal - 1,) or state_value.shape != (goal - 1,):
+            raise ValueError('The warm start does not match the goal.')
+
+    scheduler = get_scheduler(scheduler, tolerance)
+    if scheduler is not None:
+        backups, sweeps = scheduler.backups, scheduler.sweeps
+        policy, state_value = scheduled_gamble(p, goal, state_value, scheduler, verbose)
+        add_counts(stats, sweeps=scheduler.sweeps - sweeps, backups=scheduler.backups - backups)
+        return policy, state_value
+
+    if goal <= MDP_MAX_GOAL:
+        # Action a of the MDP is a stake of a+1, and a single sweep per evaluation matches the loop below
+        policy, state_value, mdp_stats = policy_iteration(
+            gambler_mdp(p, goal), 'iterative' if evaluation == 'sweep' else 'direct', tolerance, sweeps=1,
+            policy=policy - 1, values=state_value, verbose=verbose)
+        add_counts(stats, mdp_stats['iterations'], mdp_stats['sweeps'], mdp_stats['backups'])
+        return policy + 1, state_value
 
     iter = 0
     while True:
         iter += 1
-        old_state_value = state_value.copy()
-        old_policy = policy.copy()
+        old_state_value = state_value
+        old_policy = policy
 
         # Evaluate policy
-        for state in range(1, state_value.shape[0]):
-            state_value[state] = expected_return(state, policy[state], state_value, p)
+        if evaluation == 'direct':
+            state_value = solve_policy_value(policy, p, goal)
+        else:
+            state_value = policy_return(state_value, policy, p, goal)
 
         # Improve policy
-        for state in range(1, state_value.shape[0]):
-            rewards = []
-            for action in actions:
-                if action > state:
-                    rewards.append(-np.inf)
-                else:
-                    rewards.append(expected_return(state, action, state_value, p))
-            policy[state] = actions[np.argmax(rewards)]
+        policy = improve_policy(state_value, policy, p, goal)
 
         change = np.abs(state_value - old_state_value).max()
         policy_stable = (old_policy == policy).all()
-        print(f'Iter {iter} finished! SV change: {change}. Policy stable: {policy_stable}.')
+        if verbose:
+            print(f'Iter {iter} finished! SV change: {change}. Policy stable: {policy_stable}.')
         if change <= tolerance and policy_stable:
             break
 
+    add_counts(stats, iterations=iter)
+    if evaluation == 'sweep':
+        add_counts(stats, sweeps=iter, backups=iter * (goal - 1))
     return policy, state_value
 
 
+def _batch_dtype(goal):
+    return np.dtype([('p', float), ('iterations', int), ('converged', bool),
+                     ('policy', int, (goal - 1,)), ('state_value', float, (goal - 1,))])
+
+
+def gamble_batch(ps, goal, tolerance=1e-1, evaluation='sweep', max_iter=10000, workers=1, verbose=False):
+    """
+    Solve the gambler's problem for many probabilities of winning at once. Values of every problem are stacked
+    in a single array and swept together, and each problem stops as soon as it converges.
+    :param ps: probabilities of winning a bet.
+    :param goal: amount of money the gambler wants to reach.
+    :param tolerance: max change of the state values to consider them converged.
+    :param evaluation: 'sweep' or 'direct', see gamble.
+    :param max_iter: max number of iterations of any problem.
+    :param workers: number of processes among which the problems are split.
+    :param verbose: whether to print the progress.
+    :return: structured array with fields p, iterations, converged, policy and state_value, one row per p.
+    """
+    if evaluation not in ('sweep', 'direct'):
+        raise NotImplementedError('Evaluation "{}" has not been implemented.'.format(evaluation))
+    ps = np.asarray(ps, dtype=float).ravel()
+
+    if workers > 1 and len(ps) > 1:
+        chunks = np.array_split(ps, min(workers, len(ps)))
+        with Pool(len(chunks)) as pool:
+            results = pool.starmap(gamble_batch, [(chunk, goal, tolerance, evaluation, max_iter, 1, verbose)
+                                                  for chunk in chunks])
+        return np.concatenate(results)
+
+    result = np.zeros(len(ps), dtype=_batch_dtype(goal))
+    result['p'] = ps
+    result['policy'] = 1
+
+    active = np.arange(len(ps))
+    iter = 0
+    while len(active) and iter < max_iter:
+        iter += 1
+        p = ps[active, None]
+        state_value = result['state_value'][active]
+        policy = result['policy'][active]
+
+        # Evaluate policies
+        if evaluation == 'direct':
+            new_state_value = np.array([solve_policy_value(pol, pp, goal) for pol, pp in zip(policy, ps[active])])
+        else:
+            new_state_value = policy_return(state_value, policy, p, goal)
+
+        # Improve policies
+        new_policy = improve_policy(new_state_value, policy, p, goal)
+
+        change = np.abs(new_state_value - state_value).max(axis=1)
+        converged = (change <= tolerance) & (new_policy == policy).all(axis=1)
+        result['state_value'][active] = new_state_value
+        result['policy'][active] = new_policy
+        result['iterations'][active] = iter
+        result['converged'][active] = converged
+        active = active[~converged]
+        if verbose:
+            print(f'Iter {iter} finished! Max SV change: {change.max()}. Problems left: {len(active)}.')
+
+    return result
+
+
 if __name__ == '__main__':
     p = 0.45
-    policy, state_value = gamble(p=p, goal=100, tolerance=1e-5)
+    goal = 100
+    policy, state_value = gamble(p=p, goal=goal, tolerance=1e-5)
+    capitals = np.arange(1, goal)
 
-    plt.plot(policy)
+    plt.plot(capitals, policy)
     plt.title('Policy')
     plt.xlabel('Money')
     plt.ylabel('Gamble')
     plt.savefig(f'graphs/gamblers_problem_policy_p{p}.png')
     plt.show()
 
-    plt.plot(state_value)
-    plt.axvline(p*100, 0, 1, color='black', ls='--')
+    plt.plot(capitals, state_value)
+    plt.axvline(p*goal, 0, 1, color='black', ls='--')
     plt.title('State Value')
     plt.xlabel('Money')
     plt.ylabel('Probability of succeed')
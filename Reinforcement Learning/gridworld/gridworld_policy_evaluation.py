@@ -9,8 +9,11 @@ The outcome is a state value matrix for each of the possible states.
 
 import numpy as np
 from itertools import product
+from scipy import sparse
 import matplotlib.pyplot as plt
 import seaborn as sns
+from backup_scheduler import get_scheduler
+from tabular_mdp import TabularMDP, add_counts
 
 ACTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
 ACTION_PROBA = 1 / len(ACTIONS)
@@ -30,55 +33,147 @@ def make_action(state, action, world_size, reward=-1):
         return new_state.tolist(), reward, True
 
 
-def policy_greedy(state_value_per_action):
-    """Returns the greediest action"""
-    return np.max(state_value_per_action)
-
-
-def policy_random(state_value_per_action):
-    """If actions are taken at random, then the value of a state is its mean"""
-    return np.mean(state_value_per_action)
-
-
-def iterative_state_evaluation(gamma=1, policy='greedy', world_size=5, verbose=10, max_iter=1000):
+def policy_greedy(state_value_per_action, axis=None):
+    """Returns the greediest action. Illegal actions may be given as nan."""
+    return np.nanmax(state_value_per_action, axis=axis)
+
+
+def policy_random(state_value_per_action, axis=None):
+    """If actions are taken at random, then the value of a state is its mean. Illegal actions may be given as nan."""
+    return np.nanmean(state_value_per_action, axis=axis)
+
+
+def terminal_mask(world_size):
+    """Boolean matrix which is True on terminal states"""
+    terminal = np.zeros((world_size, world_size), dtype=bool)
+    terminal[0, 0] = terminal[-1, -1] = True
+    return terminal
+
+
+def action_values(state_values, gamma, reward=-1):
+    """
+    Value of taking each action in every state at once, by shifting a padded copy of the state values.
+    :param state_values: state value matrix.
+    :param gamma: discount rate.
+    :param reward: reward of every move.
+    :return: array of shape (len(ACTIONS), rows, columns). Moves out of the grid are nan.
+    """
+    rows, columns = state_values.shape
+    padded = np.pad(state_values, 1, constant_values=np.nan)
+    values = np.empty((len(ACTIONS), rows, columns))
+    for a, (dx, dy) in enumerate(ACTIONS):
+        values[a] = padded[1+dx:1+dx+rows, 1+dy:1+dy+columns]
+    return reward + gamma * values
+
+
+def gridworld_mdp(world_size=5, gamma=1, reward=-1):
+    """
+    Compile the gridworld into a TabularMDP. Moves out of the grid are illegal and terminal states have no
+    transitions, so their value stays at zero.
+    :param world_size: number of rows and columns.
+    :param gamma: discount rate.
+    :param reward: reward of every move.
+    :return: TabularMDP and array of shape (n_actions, n_states) with the probabilities of the random policy.
+    """
+    n_states = world_size ** 2
+    x, y = np.divmod(np.arange(n_states), world_size)
+    terminal = terminal_mask(world_size).ravel()
+    rows, cols = [], []
+    rewards = np.zeros((len(ACTIONS), n_states))
+    legal = np.zeros((len(ACTIONS), n_states), dtype=bool)
+    for a, (dx, dy) in enumerate(ACTIONS):
+        inside = (x + dx >= 0) & (x + dx < world_size) & (y + dy >= 0) & (y + dy < world_size)
+        legal[a] = inside | terminal
+        moves = np.flatnonzero(inside & ~terminal)
+        rows.append(a * n_states + moves)
+        cols.append(moves + dx * world_size + dy)
+        rewards[a, moves] = reward
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    transitions = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(ACTIONS) * n_states, n_states))
+
+    return TabularMDP(transitions, rewards, gamma, legal), legal / legal.sum(axis=0)
+
+
+def scheduled_state_evaluation(gamma, policy_func, world_size, scheduler, verbose=True):
+    """Evaluate the gridworld backing up one state at a time, in the order decided by a scheduler."""
+    neighbours = {}
+    rows, cols, data = [], [], []
+    for x, y in product(range(world_size), range(world_size)):
+        if is_terminal(x, y, world_size):
+            continue
+        state = x * world_size + y
+        neighbours[state] = []
+        for action in ACTIONS:
+            next_state, r, legal = make_action((x, y), action, world_size)
+            if legal:
+                neighbours[state].append((next_state[0] * world_size + next_state[1], r))
+
+        # A mean moves with a fraction of each neighbour's change, other policies (e.g. max) with all of it
+        weight = 1 / len(neighbours[state]) if policy_func is policy_random else 1
+        for next_state, _ in neighbours[state]:
+            rows.append(state)
+            cols.append(next_state)
+            data.append(gamma * weight)
+    dependencies = sparse.csr_matrix((data, (rows, cols)), shape=(world_size**2, world_size**2))
+
+    def backup(state, values):
+        return policy_func([r + gamma * values[next_state] for next_state, r in neighbours[state]])
+
+    state_values = scheduler.run(np.zeros(world_size**2), backup, list(neighbours), dependencies)
+    if verbose:
+        print('Backups ({}): {}'.format(scheduler.strategy, scheduler.backups))
+    return state_values.reshape(world_size, world_size)
+
+
+def iterative_state_evaluation(gamma=1, policy='greedy', world_size=5, verbose=10, max_iter=1000, scheduler=None,
+                               stats=None):
     if gamma < 0 or gamma > 1:
         raise ValueError('gamma must be between 0 and 1.')
 
-    # Select policy
-    if policy.lower() == 'greedy':
+    # Select policy. Custom policies receive the value of each action and an axis to reduce, like np.nanmean.
+    if callable(policy):
+        policy_func = policy
+    elif policy.lower() == 'greedy':
         policy_func = policy_greedy
     elif policy.lower() == 'random':
         policy_func = policy_random
-    elif callable(policy):
-        policy_func = policy
     else:
         raise NotImplementedError('Policy "{}" has not been implemented.'.format(policy))
-    print('Running "{}" policy.'.format(policy.title()))
+    print('Running "{}" policy.'.format(getattr(policy, '__name__', policy).title()))
+
+    # Optionally, let a scheduler decide which states to back up
+    scheduler = get_scheduler(scheduler, tolerance=1e-3)
+    if scheduler is not None:
+        backups, sweeps = scheduler.backups, scheduler.sweeps
+        state_values = scheduled_state_evaluation(gamma, policy_func, world_size, scheduler, verbose)
+        add_counts(stats, sweeps=scheduler.sweeps - sweeps, backups=scheduler.backups - backups)
+        return state_values
+
+    terminal = terminal_mask(world_size)
+    if callable(policy):
+        # Custom policies are applied to the value of every action, moves out of the grid being nan
+        def sweep(values):
+            return np.where(terminal, values, policy_func(action_values(values, gamma), axis=0))
+    else:
+        # The greedy and random policies back up the compiled TabularMDP, whose terminal states keep their value
+        mdp, random_policy = gridworld_mdp(world_size, gamma)
+        if policy_func is policy_greedy:
+            def sweep(values):
+                return mdp.q_values(values.ravel()).max(axis=0).reshape(values.shape)
+        else:
+            transition, reward = mdp.policy_model(random_policy)
+
+            def sweep(values):
+                return (reward + gamma * (transition @ values.ravel())).reshape(values.shape)
 
     state_values = np.zeros((world_size, world_size))
 
     iter = 0
     # Loop until the values converge or the maximum of iterations has been reached
     while iter < max_iter:
-        old_state_values = state_values.copy()
-        # For each of the possible states
-        for x, y in product(range(world_size), range(world_size)):
-            if is_terminal(x, y, world_size):
-                # No evaluation here
-                continue
-
-            # Recalculate the state value
-            state_value = []
-            for action in ACTIONS:
-                # Get the reward for the action and the new state
-                next_state, r, legal = make_action((x, y), action, world_size)
-                if legal:
-                    next_x, next_y = next_state
-                    # Save the value
-                    state_value.append(r + gamma * state_values[next_x, next_y])
-
-            # Action probability may be included outside the loop because this is a equiprobable problem
-            state_values[x, y] = policy_func(state_value)
+        old_state_values = state_values
+        # Recalculate the value of every state from its neighbours, terminal states are not evaluated
+        state_values = sweep(old_state_values)
 
         # Calculate changes
         delta = np.sum(np.abs(state_values - old_state_values))
@@ -91,6 +186,7 @@ def iterative_state_evaluation(gamma=1, policy='greedy', world_size=5, verbose=1
         elif verbose and (iter-1) % verbose == 0:
             print('Iter: {}. Delta: {:.2f}'.format(iter, delta))
 
+    add_counts(stats, iterations=iter, sweeps=iter, backups=iter * int((~terminal).sum()))
     return state_values
 
 
@@ -10,13 +10,21 @@ he receives an amount d for every rented car. If there are no cars available the
 receives nothing. He may have up to n cars in stock between both locations. m cars may
 be moved between locations each night. Rentals and requests follow a poisson distribution.
 The idea is to maximize jack's profit.
+
+The problem is generalised to any number of locations through RentalProblem. Locations are
+independent once the cars have been moved, so the dynamics are stored per location.
 """
+import time
+from multiprocessing import Pool, shared_memory
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
 from scipy.stats import poisson
-from itertools import product
+from solution_cache import cached_solve
+from backup_scheduler import get_scheduler
+from tabular_mdp import TabularMDP, add_counts, policy_iteration
 import matplotlib.pyplot as plt
 import seaborn as sns
-from tqdm import tqdm
 
 RENTAL_PRICE = 10
 MOVE_COST = 2
@@ -28,13 +36,20 @@ DISCOUNT_RATE = 0.9
 TOLERANCE = 1e-1
 POISSON_TOLERANCE = 1e-4
 COST_STORAGE = 4
+EVALUATIONS = ('iterative', 'direct', 'modified')
+# Problems with up to this many states are solved as a TabularMDP, whose size grows with their square
+MDP_MAX_STATES = 500
+
+# Per process state of the policy improvement workers
+_worker = {}
 
 
-def get_poisson_dict(l, ns):
+def get_poisson_dict(l, ns, tolerance=POISSON_TOLERANCE):
     """
     Calculate probabilities from a Poisson distribution.
     :param l: int. Expected number.
     :param ns: int. Max consecutive possibility
+    :param tolerance: probabilities smaller than this are dropped.
     :return: dictionary with {number: probability} for each n from 0 to ns.
     """
     total = 0
@@ -45,7 +60,7 @@ def get_poisson_dict(l, ns):
         proba = poisson.pmf(n, l)
 
         # Speed up computation by smoothing small values
-        if proba >= POISSON_TOLERANCE:
+        if proba >= tolerance:
             total += proba
             d[n] = proba
 
@@ -71,7 +86,8 @@ def expected_reward(state, action, state_value, request_probas, return_probas, n
     # Execute the action
     first_cars = min(state[0] - action, STOCK_LIMIT)
     second_cars = min(state[1] + action, STOCK_LIMIT)
-    moved_cars = abs(state[0] - first_cars)
+    # Every car moved is paid, even if it does not fit in the other location, as in action_outcomes
+    moved_cars = abs(action)
     paid_moved_cars = max(moved_cars - n_free, 0)
     reward = paid_moved_cars * -MOVE_COST
 
@@ -84,8 +100,6 @@ def expected_reward(state, action, state_value, request_probas, return_probas, n
             # Rent reward
             rented1 = min(rq1, first_cars)
             rented2 = min(rq2, second_cars)
-            new_first_cars = first_cars - rented1
-            new_second_cars = second_cars - rented2
             rent_reward = (rented1 + rented2) * RENTAL_PRICE
 
             # Loop to get the value of each possible return
@@ -95,15 +109,16 @@ def expected_reward(state, action, state_value, request_probas, return_probas, n
                     return_proba = rt1_proba * rt2_proba
 
                     # Update number of cars
-                    new_first_cars = min(new_first_cars + rt1, STOCK_LIMIT)
-                    new_second_cars = min(new_second_cars + rt2, STOCK_LIMIT)
+                    new_first_cars = min(first_cars - rented1 + rt1, STOCK_LIMIT)
+                    new_second_cars = min(second_cars - rented2 + rt2, STOCK_LIMIT)
 
                     # Update storage cost
                     storage_cost = 0
-                    if new_first_cars > n_max_storage:
-                        storage_cost += 4
-                    if new_second_cars > n_max_storage:
-                        storage_cost += 4
+                    if n_max_storage is not None:
+                        if new_first_cars > n_max_storage:
+                            storage_cost -= COST_STORAGE
+                        if new_second_cars > n_max_storage:
+                            storage_cost -= COST_STORAGE
 
                     # Update state reward
                     reward += (request_proba * return_proba) * \
@@ -113,72 +128,476 @@ def expected_reward(state, action, state_value, request_probas, return_probas, n
     return reward
 
 
-def optimise_rental(n_free=0, n_max_storage=None):
+class RentalProblem:
     """
-    Optimise the rental problem.
-    :param n_free: number of cars that one may move from one location to the other free of charge.
-    :param n_max_storage: number of cars allowed to expend the night free of charge.
-    :return: policy and state value matrices.
-    """
-    state_value = np.zeros((STOCK_LIMIT+1, STOCK_LIMIT+1))
-    policy = np.zeros((STOCK_LIMIT+1, STOCK_LIMIT+1), dtype=np.int)
-    actions = [(-MOVE_LIMIT + i) for i in range(MOVE_LIMIT*2 + 1)]
-
-    # Calculate the poisson probabilities of each outcome for the store 0 and 1 and normalise their probabilities
-    request_probas = []
-    for l in REQUEST_LAMBDAS:
-        request_probas.append(get_poisson_dict(l, STOCK_LIMIT))
-    return_probas = []
-    for l in RETURN_LAMBDAS:
-        return_probas.append(get_poisson_dict(l, STOCK_LIMIT))
-
-    # Evaluate subsequently improved policies until no improvements can be done
-    improvement = True
-    iter = 0
-    while improvement:
-        iter += 1
-        improvement = False
-        state_change = TOLERANCE * 2
-        print('*--'*10)
-        print('Begining policy evaluation...')
-
-        # Evaluate the current policy
-        eval_iters = 0
-        while state_change > TOLERANCE:
-            old_state_value = state_value.copy()
-            for n_first, n_second in product(range(STOCK_LIMIT+1), range(STOCK_LIMIT+1)):
-                state_value[n_first, n_second] = expected_reward((n_first, n_second), policy[n_first, n_second],
-                                                                 state_value, request_probas, return_probas,
-                                                                 n_free, n_max_storage)
-            state_change = abs(old_state_value - state_value).max()
-            eval_iters += 1
-            print(state_change)
-        print('Policy evaluation finished!')
-
-        # Use new values to improve the policy
-        with tqdm(total=(STOCK_LIMIT+1)**2, desc="Improving policy") as pbar:
-            for n_first, n_second in product(range(STOCK_LIMIT + 1), range(STOCK_LIMIT + 1)):
-                actions_reward = []
-                for action in actions:
-                    # If we have enough cars to perform the action
-                    if (0 <= action <= n_first) or (-n_second <= action <= 0):
-                        actions_reward.append(expected_reward((n_first, n_second), action, state_value,
-                                                              request_probas, return_probas, n_free, n_max_storage))
-                    else:
-                        actions_reward.append(-np.inf)
-                pbar.update(1)
-
-                # Select best action
-                best_action = actions[np.argmax(actions_reward)]
-                if policy[n_first, n_second] != best_action:
-                    policy[n_first, n_second] = best_action
-                    improvement = True
-
-        print(f'\nIteration {iter} finished! Policy improved: {improvement}. Evaluation iters: {eval_iters}')
+    Parameters of a rental problem with any number of locations. Defaults are those of Jack's problem.
+    """
+    def __init__(self, request_lambdas=REQUEST_LAMBDAS, return_lambdas=RETURN_LAMBDAS, stock_limit=STOCK_LIMIT,
+                 move_limit=MOVE_LIMIT, rental_price=RENTAL_PRICE, move_cost=MOVE_COST, n_free=0,
+                 n_max_storage=None, cost_storage=COST_STORAGE, discount_rate=DISCOUNT_RATE, tolerance=TOLERANCE,
+                 poisson_tolerance=POISSON_TOLERANCE):
+        if len(request_lambdas) != len(return_lambdas):
+            raise ValueError('There must be as many request lambdas as return lambdas.')
+        if discount_rate < 0 or discount_rate >= 1:
+            raise ValueError('discount_rate must be between 0 and 1 (not included).')
+        self.request_lambdas = tuple(request_lambdas)
+        self.return_lambdas = tuple(return_lambdas)
+        self.stock_limit = stock_limit
+        self.move_limit = move_limit
+        self.rental_price = rental_price
+        self.move_cost = move_cost
+        self.n_free = n_free
+        self.n_max_storage = n_max_storage
+        self.cost_storage = cost_storage
+        self.discount_rate = discount_rate
+        self.tolerance = tolerance
+        self.poisson_tolerance = poisson_tolerance
+        self.actions = rental_actions(self.n_locations, move_limit)
+
+    @property
+    def n_locations(self):
+        return len(self.request_lambdas)
+
+    @property
+    def shape(self):
+        """Shape of the state space, one axis per location"""
+        return (self.stock_limit + 1,) * self.n_locations
+
+    def params(self):
+        """Every parameter of the problem, as a json serialisable dict"""
+        return {'n_locations': self.n_locations, 'request_lambdas': list(self.request_lambdas),
+                'return_lambdas': list(self.return_lambdas), 'stock_limit': self.stock_limit,
+                'move_limit': self.move_limit, 'rental_price': self.rental_price, 'move_cost': self.move_cost,
+                'n_free': self.n_free, 'n_max_storage': self.n_max_storage, 'cost_storage': self.cost_storage,
+                'discount_rate': self.discount_rate, 'tolerance': self.tolerance,
+                'poisson_tolerance': self.poisson_tolerance}
+
+
+def rental_actions(n_locations, move_limit):
+    """
+    Each night up to move_limit cars may be moved from one location to another.
+    :param n_locations: number of locations.
+    :param move_limit: max number of cars moved in a night.
+    :return: array of shape (n_actions, n_locations) with the change of cars in each location. With two
+    locations, the second column is the number of cars moved from location 1 to 2, from -move_limit to move_limit.
+    """
+    actions = [np.zeros(n_locations, dtype=int)]
+    for source in range(n_locations):
+        for destination in range(source + 1, n_locations):
+            for n in range(-move_limit, move_limit + 1):
+                if n == 0:
+                    continue
+                action = np.zeros(n_locations, dtype=int)
+                action[source] = -n
+                action[destination] = n
+                actions.append(action)
+
+    # Keep "no move" sorted among the moves between the first two locations
+    actions = np.array(actions).reshape(-1, n_locations)
+    if n_locations > 1:
+        actions = np.concatenate((actions[1:move_limit+1], actions[:1], actions[move_limit+1:]))
+    return actions
+
+
+def location_model(problem, location):
+    """
+    Build the dynamics of a single location.
+    :param problem: RentalProblem.
+    :param location: index of the location.
+    :return: transition matrix, where [m, n] is the probability of ending the day with n cars after opening
+    it with m, and vector with the expected reward (rentals minus storage) of opening the day with m cars.
+    """
+    stock_limit = problem.stock_limit
+    request_probas = get_poisson_dict(problem.request_lambdas[location], stock_limit, problem.poisson_tolerance)
+    return_probas = get_poisson_dict(problem.return_lambdas[location], stock_limit, problem.poisson_tolerance)
+
+    transition = np.zeros((stock_limit + 1, stock_limit + 1))
+    reward = np.zeros(stock_limit + 1)
+    for cars in range(stock_limit + 1):
+        for rq, rq_proba in request_probas.items():
+            rented = min(rq, cars)
+            reward[cars] += rq_proba * rented * problem.rental_price
+            for rt, rt_proba in return_probas.items():
+                transition[cars, min(cars - rented + rt, stock_limit)] += rq_proba * rt_proba
+
+    if problem.n_max_storage is not None:
+        reward -= problem.cost_storage * transition[:, problem.n_max_storage+1:].sum(axis=1)
+
+    return transition, reward
+
+
+def location_models(problem):
+    """Build the transition matrix and expected reward vector of every location"""
+    transitions, rewards = [], []
+    for location in range(problem.n_locations):
+        transition, reward = location_model(problem, location)
+        transitions.append(transition)
+        rewards.append(reward)
+    return transitions, rewards
+
+
+def action_outcomes(problem):
+    """
+    Precompute the effect of every action on each location.
+    :param problem: RentalProblem.
+    :return: arrays of shape (n_actions, stock_limit+1, n_locations) with the cars left in a location after the
+    action and whether the location has enough cars to do it, and vector with the reward of each action.
+    """
+    states = np.arange(problem.stock_limit + 1)[None, :, None]
+    actions = problem.actions[:, None, :]
+    after = np.clip(states + actions, 0, problem.stock_limit)
+    legal = states + actions >= 0
+    moved_cars = np.abs(problem.actions).max(axis=1)
+    move_reward = np.maximum(moved_cars - problem.n_free, 0) * -problem.move_cost
+    return after, legal, move_reward
+
+
+def _outer(arrays):
+    """Reshape one vector per location so that they broadcast over the joint state space"""
+    n = len(arrays)
+    return tuple(array.reshape([-1 if i == k else 1 for i in range(n)]) for k, array in enumerate(arrays))
+
+
+def _action_arrays(outcomes, action, rows=None):
+    """Per location after-move cars and legality of an action, optionally only for some first location rows"""
+    after, legal, _ = outcomes
+    after = [after[action, :, k] for k in range(after.shape[2])]
+    legal = [legal[action, :, k] for k in range(legal.shape[2])]
+    if rows is not None:
+        after[0] = after[0][rows]
+        legal[0] = legal[0][rows]
+    return _outer(after), _outer(legal)
+
+
+def after_move_value(state_value, transitions, rewards, discount_rate):
+    """
+    Expected return of opening the day with any number of cars in each location.
+    :param state_value: state value array, one axis per location.
+    :param transitions: list with the transition matrix of each location.
+    :param rewards: list with the expected reward vector of each location.
+    :param discount_rate: discount of next day's value.
+    :return: array with the value of each after-move state.
+    """
+    # Apply each location's transition along its own axis instead of building the joint transition
+    value = discount_rate * state_value
+    for k, transition in enumerate(transitions):
+        value = np.moveaxis(np.tensordot(transition, value, axes=(1, k)), 0, k)
+    for reward in _outer(rewards):
+        value = value + reward
+    return value
+
+
+def policy_after_move(policy, outcomes):
+    """
+    Flat index of the after-move state reached by following the policy in every state.
+    :param policy: array with the action index of each state.
+    :param outcomes: tuple returned by action_outcomes.
+    :return: array with the flat after-move index and array with the move reward of each state.
+    """
+    after_idx = np.zeros(policy.shape, dtype=int)
+    policy_reward = np.zeros(policy.shape)
+    for action in np.unique(policy):
+        after, _ = _action_arrays(outcomes, action)
+        mask = policy == action
+        after_idx[mask] = np.broadcast_to(np.ravel_multi_index(after, policy.shape), policy.shape)[mask]
+        policy_reward[mask] = outcomes[2][action]
+    return after_idx, policy_reward
+
+
+def policy_transition_matrix(after_idx, transitions):
+    """
+    Build the state transition matrix of a fixed policy. Its size grows with the square of the number of states,
+    so this is only meant for a few locations.
+    :param after_idx: array with the flat after-move index of each state under the policy.
+    :param transitions: list with the transition matrix of each location.
+    :return: sparse matrix where [s, s'] is the probability of moving from flat state s to s'.
+    """
+    # Locations are independent, so the joint transition of an after-move state is a kronecker product
+    joint = sparse.csr_matrix(transitions[0])
+    for transition in transitions[1:]:
+        joint = sparse.kron(joint, sparse.csr_matrix(transition), format='csr')
+    return joint[after_idx.ravel()]
+
+
+def solve_policy_value(after_idx, policy_reward, transitions, rewards, discount_rate):
+    """
+    Evaluate a fixed policy exactly by solving (I - gamma * P) v = r.
+    :param after_idx: array with the flat after-move index of each state under the policy.
+    :param policy_reward: array with the reward of moving the cars under the policy.
+    :param transitions: list with the transition matrix of each location.
+    :param rewards: list with the expected reward vector of each location.
+    :param discount_rate: discount of next day's value.
+    :return: state value array.
+    """
+    transition = policy_transition_matrix(after_idx, transitions)
+    expected = policy_reward.ravel() + sum(_outer(rewards)).ravel()[after_idx.ravel()]
+    system = sparse.identity(transition.shape[0], format='csr') - discount_rate * transition
+    return spsolve(system.tocsc(), expected).reshape(policy_reward.shape)
+
+
+def scheduled_policy_value(state_value, after_idx, policy_reward, transitions, rewards, discount_rate, scheduler):
+    """
+    Evaluate a fixed policy backing up one state at a time, in the order decided by a scheduler.
+    :param state_value: state value array to start from.
+    :param after_idx: array with the flat after-move index of each state under the policy.
+    :param policy_reward: array with the reward of moving the cars under the policy.
+    :param transitions: list with the transition matrix of each location.
+    :param rewards: list with the expected reward vector of each location.
+    :param discount_rate: discount of next day's value.
+    :param scheduler: BackupScheduler.
+    :return: state value array.
+    """
+    transition = policy_transition_matrix(after_idx, transitions)
+    expected = policy_reward.ravel() + sum(_outer(rewards)).ravel()[after_idx.ravel()]
+    indptr, indices, data = transition.indptr, transition.indices, discount_rate * transition.data
+
+    def backup(state, values):
+        start, end = indptr[state], indptr[state+1]
+        return expected[state] + data[start:end] @ values[indices[start:end]]
+
+    values = scheduler.run(state_value.ravel().copy(), backup, dependencies=discount_rate * transition)
+    return values.reshape(state_value.shape)
+
+
+def improve_policy(value, outcomes, rows=None):
+    """
+    Select the greediest action of each state. Ties are broken in favour of the first action.
+    :param value: array with the value of each after-move state.
+    :param outcomes: tuple returned by action_outcomes.
+    :param rows: only improve the states with these numbers of cars in the first location.
+    :return: array with the index of the best action of each state.
+    """
+    move_reward = outcomes[2]
+    best_reward = best_action = None
+    for action in range(len(move_reward)):
+        after, legal = _action_arrays(outcomes, action, rows)
+        actions_reward = np.where(np.logical_and.reduce(np.broadcast_arrays(*legal)),
+                                  move_reward[action] + value[after], -np.inf)
+        if best_reward is None:
+            best_reward = actions_reward
+            best_action = np.zeros(actions_reward.shape, dtype=int)
+        else:
+            better = actions_reward > best_reward
+            best_reward = np.where(better, actions_reward, best_reward)
+            best_action[better] = action
+    return best_action
+
+
+def rental_mdp(problem):
+    """
+    Compile a rental problem into a TabularMDP over the joint state space, with the actions of problem.actions.
+    Its size grows with the square of the number of states, so use solve_rental for more than a few locations.
+    :param problem: RentalProblem.
+    :return: TabularMDP. States are flattened as np.ravel_multi_index does with problem.shape.
+    """
+    transitions, rewards = location_models(problem)
+    outcomes = action_outcomes(problem)
+    joint = sparse.csr_matrix(transitions[0])
+    for transition in transitions[1:]:
+        joint = sparse.kron(joint, sparse.csr_matrix(transition), format='csr')
+    after_move_reward = sum(_outer(rewards)).ravel()
+
+    action_transitions, action_rewards, legal = [], [], []
+    for action in range(len(problem.actions)):
+        after, action_legal = _action_arrays(outcomes, action)
+        after = np.broadcast_to(np.ravel_multi_index(after, problem.shape), problem.shape).ravel()
+        action_transitions.append(joint[after])
+        action_rewards.append(outcomes[2][action] + after_move_reward[after])
+        legal.append(np.logical_and.reduce(np.broadcast_arrays(*action_legal)).ravel())
+
+    return TabularMDP(action_transitions, action_rewards, problem.discount_rate, legal)
+
+
+def _init_improvement_worker(shm_name, shape, outcomes):
+    """Attach the worker to the shared value array and keep the action outcomes, which never change."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['value'] = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    _worker['outcomes'] = outcomes
+
+
+def _improve_rows(rows):
+    """Improve the policy of the states whose first location has rows cars."""
+    return improve_policy(_worker['value'], _worker['outcomes'], rows)
+
+
+def solve_rental(problem, evaluation='iterative', sweeps=5, workers=1, verbose=True, warm_start=None, cache=None,
+                 scheduler=None, stats=None):
+    """
+    Find the optimal policy of a rental problem by policy iteration.
+    :param problem: RentalProblem.
+    :param evaluation: how to evaluate each policy. 'iterative' sweeps until the values change less than the
+    problem's tolerance, 'direct' solves the linear system of the policy and 'modified' does only a fixed number
+    of sweeps.
+    :param sweeps: number of sweeps per evaluation when using 'modified'.
+    :param workers: number of processes used to improve the policy. States are split among them.
+    :param verbose: whether to print the progress.
+    :param warm_start: tuple with the policy and state value arrays to start from.
+    :param cache: SolutionCache or directory where solutions are stored. Solved problems are read from it and
+    unsolved ones start from the closest cached solution.
+    :param scheduler: BackupScheduler or name of its strategy. If given, 'iterative' evaluation backs up one state
+    at a time in the order decided by the scheduler instead of sweeping all of them at once.
+    :param stats: dict where iterations, sweeps and backups are counted, see tabular_mdp. Cached solutions count none.
+    :return: array with the index in problem.actions of each state's action and state value array.
+
+    Problems with up to MDP_MAX_STATES states, solved without workers or a scheduler, are compiled with rental_mdp
+    and solved by tabular_mdp.policy_iteration. Larger ones use the per-location dynamics below.
+    """
+    if cache is not None:
+        return cached_solve(cache, 'rental', problem.params(),
+                            lambda warm: solve_rental(problem, evaluation, sweeps, workers, verbose, warm,
+                                                      scheduler=scheduler, stats=stats),
+                            same=('n_locations', 'stock_limit', 'move_limit'))
+
+    if evaluation not in EVALUATIONS:
+        raise NotImplementedError('Evaluation "{}" has not been implemented.'.format(evaluation))
+    if evaluation == 'modified' and sweeps < 1:
+        raise ValueError('sweeps must be at least 1.')
+    if workers < 1:
+        raise ValueError('workers must be at least 1.')
+    scheduler = get_scheduler(scheduler, problem.tolerance)
+    if scheduler is not None and evaluation != 'iterative':
+        raise ValueError('A scheduler may only be used with iterative evaluation.')
+
+    timings = {'model': 0., 'evaluation': 0., 'improvement': 0.}
+    start_time = time.perf_counter()
+
+    tolerance = problem.tolerance
+    discount_rate = problem.discount_rate
+    if warm_start is None:
+        state_value = np.zeros(problem.shape)
+        no_move = int(np.flatnonzero(~problem.actions.any(axis=1))[0])
+        policy = np.full(problem.shape, no_move, dtype=int)
+    else:
+        policy = np.array(warm_start[0], dtype=int)
+        state_value = np.array(warm_start[1], dtype=float)
+        if policy.shape != problem.shape or state_value.shape != problem.shape:
+            raise ValueError('The warm start does not match the shape of the problem.')
+
+    # Small problems solved in a single process go through the shared solvers. Ties are broken in favour of the
+    # first action, as improve_policy does, so that they reach the same policy as with workers.
+    if workers == 1 and scheduler is None and policy.size <= MDP_MAX_STATES:
+        mdp = rental_mdp(problem)
+        timings['model'] += time.perf_counter() - start_time
+        policy, state_value, mdp_stats = policy_iteration(
+            mdp, 'direct' if evaluation == 'direct' else 'iterative', tolerance,
+            sweeps if evaluation == 'modified' else None, policy=policy.ravel(), values=state_value.ravel(),
+            verbose=verbose, keep_ties=False)
+        add_counts(stats, mdp_stats['iterations'], mdp_stats['sweeps'], mdp_stats['backups'])
+        timings['evaluation'] += mdp_stats['evaluation_seconds']
+        timings['improvement'] += mdp_stats['improvement_seconds']
+        if verbose:
+            print('Time spent: ' + ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in timings.items()))
+        return policy.reshape(problem.shape), state_value.reshape(problem.shape)
+
+    # Build each location's dynamics and the outcome of each action only once
+    transitions, rewards = location_models(problem)
+    outcomes = action_outcomes(problem)
+    timings['model'] += time.perf_counter() - start_time
+
+    # Policy improvement is independent per state, so it may be split among processes
+    pool = shm = None
+    if workers > 1:
+        shm = shared_memory.SharedMemory(create=True, size=state_value.nbytes)
+        shared_value = np.ndarray(state_value.shape, dtype=float, buffer=shm.buf)
+        shards = np.array_split(np.arange(problem.stock_limit+1), min(workers, problem.stock_limit+1))
+        pool = Pool(workers, initializer=_init_improvement_worker, initargs=(shm.name, state_value.shape, outcomes))
+
+    try:
+        # Evaluate subsequently improved policies until no improvements can be done.
+        # Modified evaluation may stop short of convergence, so it also needs the values to settle.
+        improvement = True
+        state_change = tolerance * 2
+        iter = 0
+        while improvement or state_change > tolerance:
+            iter += 1
+            if verbose:
+                print('*--'*10)
+                print('Begining policy evaluation...')
+            start_time = time.perf_counter()
+
+            # Evaluate the current policy
+            after_idx, policy_reward = policy_after_move(policy, outcomes)
+            eval_iters = 0
+            if evaluation == 'direct':
+                state_value = solve_policy_value(after_idx, policy_reward, transitions, rewards, discount_rate)
+                state_change = 0
+            elif scheduler is not None:
+                backups, scheduler_sweeps = scheduler.backups, scheduler.sweeps
+                state_value = scheduled_policy_value(state_value, after_idx, policy_reward, transitions, rewards,
+                                                     discount_rate, scheduler)
+                state_change = 0
+                if verbose:
+                    print(f'Backups: {scheduler.backups - backups}')
+                add_counts(stats, sweeps=scheduler.sweeps - scheduler_sweeps, backups=scheduler.backups - backups)
+            else:
+                state_change = tolerance * 2
+                while state_change > tolerance and (evaluation == 'iterative' or eval_iters < sweeps):
+                    value = after_move_value(state_value, transitions, rewards, discount_rate)
+                    new_state_value = policy_reward + value.ravel()[after_idx]
+                    state_change = abs(new_state_value - state_value).max()
+                    state_value = new_state_value
+                    eval_iters += 1
+                    if verbose:
+                        print(state_change)
+                add_counts(stats, sweeps=eval_iters, backups=eval_iters * state_value.size)
+            if verbose:
+                print('Policy evaluation finished!')
+            timings['evaluation'] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+
+            # Use new values to improve the policy, scoring all states at once
+            value = after_move_value(state_value, transitions, rewards, discount_rate)
+            if pool is None:
+                best_action = improve_policy(value, outcomes)
+            else:
+                # Workers read the values from shared memory, so only row indices are sent with each task
+                shared_value[:] = value
+                best_action = np.concatenate(pool.map(_improve_rows, shards))
+            improvement = bool((best_action != policy).any())
+            policy = best_action
+            timings['improvement'] += time.perf_counter() - start_time
+
+            add_counts(stats, iterations=1)
+            if verbose:
+                print(f'\nIteration {iter} finished! Policy improved: {improvement}. Evaluation iters: {eval_iters}')
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            shm.close()
+            shm.unlink()
+
+    if verbose:
+        print('Time spent: ' + ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in timings.items()))
+        if scheduler is not None:
+            print(f'Total backups ({scheduler.strategy}): {scheduler.backups}')
 
     return policy, state_value
 
 
+def optimise_rental(n_free=0, n_max_storage=None, evaluation='iterative', sweeps=5, workers=1, cache=None,
+                    stock_limit=STOCK_LIMIT, verbose=True, stats=None):
+    """
+    Optimise Jack's two locations rental problem.
+    :param n_free: number of cars that one may move from one location to the other free of charge.
+    :param n_max_storage: number of cars allowed to expend the night free of charge.
+    :param evaluation: how to evaluate each policy, see solve_rental.
+    :param sweeps: number of sweeps per evaluation when using 'modified'.
+    :param workers: number of processes used to improve the policy.
+    :param cache: SolutionCache or directory where solutions are stored.
+    :param stock_limit: max number of cars per location.
+    :param verbose: whether to print the progress.
+    :param stats: dict where iterations, sweeps and backups are counted.
+    :return: policy (cars moved from location 1 to 2) and state value matrices.
+    """
+    problem = RentalProblem(stock_limit=stock_limit, move_limit=min(MOVE_LIMIT, stock_limit), n_free=n_free,
+                            n_max_storage=n_max_storage)
+    policy, state_value = solve_rental(problem, evaluation=evaluation, sweeps=sweeps, workers=workers, verbose=verbose,
+                                       cache=cache, stats=stats)
+    return problem.actions[policy, 1], state_value
+
+
 if __name__ == '__main__':
     n_free = 1
     n_max_storage = 10
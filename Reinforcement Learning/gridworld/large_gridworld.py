@@ -0,0 +1,198 @@
+"""
+Policy evaluation of large rectangular gridworlds loaded from a file.
+
+Maps may have walls, which can not be entered, any number of terminal states and a reward for moving into
+each cell. State values are float32 and may live in a memory-mapped .npy file. Each sweep updates the values
+in place, a block of rows at a time, so only a block and its two neighbouring rows are ever held in memory.
+"""
+import os
+import time
+import warnings
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from gridworld_policy_evaluation import ACTIONS, policy_greedy, policy_random
+
+FREE = ord('.')
+WALL = ord('#')
+TERMINAL = ord('T')
+
+# Default number of cells updated at once
+CHUNK_CELLS = 2 ** 18
+
+
+def _chunk_rows(columns):
+    """Number of rows that fit in CHUNK_CELLS cells"""
+    return max(1, CHUNK_CELLS // columns)
+
+
+class GridMap:
+    """
+    Layout of a gridworld.
+    :param cells: uint8 matrix with a character code per cell: '.' free, '#' wall and 'T' terminal. It may be
+    memory-mapped, since it is only read a block of rows at a time.
+    :param reward: reward of moving into each cell. Either a number, a matrix or the path of a .npy file.
+    """
+    def __init__(self, cells, reward=-1):
+        chunk_rows = _chunk_rows(cells.shape[1])
+        for start in range(0, cells.shape[0], chunk_rows):
+            block = np.asarray(cells[start:start+chunk_rows])
+            unknown = (block != FREE) & (block != WALL) & (block != TERMINAL)
+            if unknown.any():
+                raise ValueError('Unknown cell "{}" in the map.'.format(chr(block[unknown][0])))
+        if isinstance(reward, str):
+            reward = np.load(reward, mmap_mode='r')
+        if np.ndim(reward) and np.shape(reward) != cells.shape:
+            raise ValueError('The rewards do not match the shape of the map.')
+
+        self.cells = cells
+        self.reward = reward
+
+    @property
+    def shape(self):
+        return self.cells.shape
+
+    @classmethod
+    def load(cls, path, reward=-1):
+        """
+        Load a map from a text file, one line per row, or from a .npy file with the character codes. Both are
+        memory-mapped: the rows of a text file are read in place, skipping their line endings.
+        """
+        if path.endswith('.npy'):
+            return cls(np.load(path, mmap_mode='r'), reward)
+
+        with open(path, 'rb') as f:
+            first_line = f.readline()
+        columns = len(first_line.rstrip(b'\r\n'))
+        line_size = len(first_line)
+        size = os.path.getsize(path)
+        # The last line may not have a line ending
+        if not columns or size % line_size not in (0, columns):
+            raise ValueError('Every row of the map must have the same length.')
+        rows = -(-size // line_size)
+
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        ending = np.frombuffer(first_line[columns:], dtype=np.uint8)
+        chunk_rows = _chunk_rows(line_size)
+        for start in range(0, size // line_size, chunk_rows):
+            n = min(chunk_rows, size // line_size - start)
+            block = data[start * line_size:(start + n) * line_size].reshape(n, line_size)
+            if (block[:, columns:] != ending).any():
+                raise ValueError('Every row of the map must have the same length.')
+        return cls(as_strided(data, (rows, columns), (line_size, 1), writeable=False), reward)
+
+
+def open_values(shape, path=None):
+    """
+    Float32 state values initialised to zero.
+    :param shape: shape of the map.
+    :param path: .npy file where values are memory-mapped. If it already exists with the same shape, its values
+    are used as a warm start.
+    :return: state value matrix.
+    """
+    if path is None:
+        return np.zeros(shape, dtype=np.float32)
+    try:
+        values = np.lib.format.open_memmap(path, mode='r+')
+        if values.shape == shape and values.dtype == np.float32:
+            return values
+    except (OSError, ValueError):
+        pass
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+
+
+def _block_action_values(grid, values, start, end, gamma):
+    """Value of each action for rows start to end, reading their neighbouring rows too"""
+    rows, columns = grid.shape
+    top, bottom = max(start - 1, 0), min(end + 1, rows)
+
+    # Value of moving into each cell of the block and its neighbouring rows, nan if it is a wall
+    reward = grid.reward[top:bottom] if np.ndim(grid.reward) else grid.reward
+    walls = np.asarray(grid.cells[top:bottom]) == WALL
+    target = np.where(walls, np.nan, reward + gamma * np.asarray(values[top:bottom], dtype=float))
+
+    # Pad with nan so that moves out of the map are illegal
+    n = end - start
+    padded = np.full((n + 2, columns + 2), np.nan)
+    padded[1 - (start - top):1 + (bottom - start), 1:-1] = target
+    action_values = np.empty((len(ACTIONS), n, columns))
+    for a, (dx, dy) in enumerate(ACTIONS):
+        action_values[a] = padded[1+dx:1+dx+n, 1+dy:1+dy+columns]
+    return action_values
+
+
+def chunked_state_evaluation(grid, gamma=1, policy='greedy', values=None, chunk_rows=None, tolerance=1e-3,
+                             max_iter=1000, verbose=10):
+    """
+    Evaluate a policy on a large gridworld, updating the values in place one block of rows at a time.
+    :param grid: GridMap.
+    :param gamma: discount rate.
+    :param policy: 'greedy', 'random' or a function reducing the action values along an axis, like np.nanmean.
+    :param values: state value matrix, e.g. from open_values, which is updated in place. Zeros by default.
+    :param chunk_rows: number of rows updated at once. By default, as many as fit in CHUNK_CELLS cells.
+    :param tolerance: stop when the sum of the absolute changes of a sweep is not greater than this.
+    :param max_iter: max number of sweeps.
+    :param verbose: print every this many sweeps.
+    :return: state value matrix.
+    """
+    if gamma < 0 or gamma > 1:
+        raise ValueError('gamma must be between 0 and 1.')
+    if callable(policy):
+        policy_func = policy
+    elif policy.lower() == 'greedy':
+        policy_func = policy_greedy
+    elif policy.lower() == 'random':
+        policy_func = policy_random
+    else:
+        raise NotImplementedError('Policy "{}" has not been implemented.'.format(policy))
+    if values is None:
+        values = open_values(grid.shape)
+
+    rows, columns = grid.shape
+    if chunk_rows is None:
+        chunk_rows = _chunk_rows(columns)
+    iter = 0
+    while iter < max_iter:
+        start_time = time.perf_counter()
+        delta = 0.
+        for start in range(0, rows, chunk_rows):
+            end = min(start + chunk_rows, rows)
+            old_values = np.asarray(values[start:end], dtype=float)
+            with warnings.catch_warnings():
+                # Cells without any legal move reduce an all-nan slice
+                warnings.simplefilter('ignore', RuntimeWarning)
+                new_values = policy_func(_block_action_values(grid, values, start, end, gamma), axis=0)
+
+            # Walls, terminal states and cells without legal moves are not evaluated
+            cells = np.asarray(grid.cells[start:end])
+            fixed = (cells == WALL) | (cells == TERMINAL) | np.isnan(new_values)
+            new_values = np.where(fixed, old_values, new_values).astype(np.float32)
+            delta += np.abs(new_values - old_values).sum()
+            values[start:end] = new_values
+        iter += 1
+
+        if delta <= tolerance:
+            print('Iter: {}. Delta: {:.2f}'.format(iter, delta))
+            break
+        elif verbose and (iter-1) % verbose == 0:
+            print('Iter: {}. Delta: {:.2f}. Sweep time: {:.2f}s'.format(iter, delta,
+                                                                      time.perf_counter() - start_time))
+
+    if isinstance(values, np.memmap):
+        values.flush()
+    return values
+
+
+def random_map(rows, columns, wall_proba=0.2, n_terminal=2, seed=None):
+    """Random map with walls and terminal states, as character codes"""
+    rng = np.random.default_rng(seed)
+    cells = np.where(rng.random((rows, columns)) < wall_proba, WALL, FREE).astype(np.uint8)
+    cells.ravel()[rng.choice(cells.size, n_terminal, replace=False)] = TERMINAL
+    return cells
+
+
+if __name__ == '__main__':
+    # A 10^7 cells map, with values memory-mapped to disk
+    np.save('large_gridworld_map.npy', random_map(2000, 5000, seed=0))
+    grid = GridMap.load('large_gridworld_map.npy')
+    values = open_values(grid.shape, 'large_gridworld_values.npy')
+    chunked_state_evaluation(grid, gamma=0.9, policy='greedy', values=values, max_iter=20, verbose=1)
@@ -0,0 +1,62 @@
+"""
+Benchmarks of the rental problem solver as the number of locations and the stock limit grow.
+
+The dynamics are stored per location, so the model grows with n_locations * (stock_limit+1)^2
+whereas a joint transition matrix would grow with (stock_limit+1)^(2*n_locations). Problems small enough to be
+solved as a TabularMDP by solve_rental do build the joint matrix, once per action, and are reported as such.
+"""
+import time
+from jacks_rental import RentalProblem, solve_rental, MDP_MAX_STATES
+
+REQUEST_LAMBDAS = (3, 4, 2, 3, 4)
+RETURN_LAMBDAS = (3, 2, 3, 2, 4)
+
+
+def benchmark(n_locations, stock_limit, evaluation='iterative', workers=1):
+    """
+    Solve a rental problem and measure it.
+    :param n_locations: number of locations.
+    :param stock_limit: max number of cars per location.
+    :param evaluation: how to evaluate each policy, see solve_rental.
+    :param workers: number of processes used to improve the policy.
+    :return: dict with the size of the problem and the seconds it took to solve it.
+    """
+    problem = RentalProblem(request_lambdas=REQUEST_LAMBDAS[:n_locations], return_lambdas=RETURN_LAMBDAS[:n_locations],
+                            stock_limit=stock_limit, move_limit=min(5, stock_limit), n_free=1,
+                            n_max_storage=stock_limit // 2)
+    start_time = time.perf_counter()
+    solve_rental(problem, evaluation=evaluation, workers=workers, verbose=False)
+    seconds = time.perf_counter() - start_time
+
+    states = (stock_limit + 1) ** n_locations
+    joint = workers == 1 and states <= MDP_MAX_STATES
+    return {'locations': n_locations,
+            'stock': stock_limit,
+            'states': states,
+            'actions': len(problem.actions),
+            'model': 'joint' if joint else 'location',
+            'model_floats': len(problem.actions) * states ** 2 if joint else n_locations * (stock_limit + 1) ** 2,
+            'joint_floats': states ** 2,
+            'seconds': seconds}
+
+
+def run(ladder, evaluation='iterative', workers=1):
+    """Benchmark every (n_locations, stock_limit) in the ladder and print a table"""
+    results = []
+    print('{:>9} {:>6} {:>9} {:>8} {:>9} {:>13} {:>13} {:>9}'.format('locations', 'stock', 'states', 'actions',
+                                                                   'model', 'model floats', 'joint floats',
+                                                                   'seconds'))
+    for n_locations, stock_limit in ladder:
+        result = benchmark(n_locations, stock_limit, evaluation, workers)
+        results.append(result)
+        print('{locations:>9} {stock:>6} {states:>9} {actions:>8} {model:>9} {model_floats:>13.3g} '
+              '{joint_floats:>13.3g} {seconds:>9.3f}'.format(**result))
+    return results
+
+
+if __name__ == '__main__':
+    print('Growing the stock limit with two locations')
+    run([(2, stock_limit) for stock_limit in (10, 20, 40, 80, 160)])
+
+    print('\nGrowing the number of locations')
+    run([(1, 20), (2, 20), (3, 20), (3, 40), (4, 10), (4, 15), (5, 6)])
@@ -0,0 +1,136 @@
+"""
+On-disk cache of solved tabular problems.
+
+Solutions are stored as .npy files in a folder named after the hash of the solver and its full
+set of parameters, so a repeated run is a lookup. When there is no exact match, the cached solution
+with the closest parameters is returned so that the solver may start from it instead of from zeros.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+
+class SolutionCache:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(solver, params):
+        """Hash identifying a solver run with the given parameters"""
+        content = json.dumps({'solver': solver, 'params': params}, sort_keys=True)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def load(self, solver, params, mmap_mode='r'):
+        """
+        Look for the exact solution of a problem.
+        :param solver: name of the solver.
+        :param params: dict with the parameters of the problem. Must be serialisable to json.
+        :param mmap_mode: how to memory-map the arrays, see np.load.
+        :return: tuple with the policy and state value arrays or None if it has not been solved yet.
+        """
+        return self._read(os.path.join(self.directory, self.key(solver, params)), mmap_mode)
+
+    def save(self, solver, params, policy, state_value):
+        """Store the policy and state value arrays of a solved problem"""
+        path = os.path.join(self.directory, self.key(solver, params))
+        if os.path.isdir(path):
+            return
+
+        # Write everything to a temporary folder first so that readers never find half an entry
+        tmp_path = tempfile.mkdtemp(dir=self.directory)
+        np.save(os.path.join(tmp_path, 'policy.npy'), policy)
+        np.save(os.path.join(tmp_path, 'state_value.npy'), state_value)
+        with open(os.path.join(tmp_path, 'params.json'), 'w') as f:
+            json.dump({'solver': solver, 'params': params}, f, sort_keys=True)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process stored the same solution meanwhile
+            shutil.rmtree(tmp_path)
+
+    def closest(self, solver, params, same=(), mmap_mode='r'):
+        """
+        Find the cached solution whose parameters are the closest to the given ones.
+        :param solver: name of the solver.
+        :param params: dict with the parameters of the problem.
+        :param same: parameters that must be equal, such as those defining the shape of the state space.
+        :param mmap_mode: how to memory-map the arrays, see np.load.
+        :return: tuple with the policy and state value arrays or None if no solution is compatible.
+        """
+        params = json.loads(json.dumps(params))
+        best_path = None
+        best_distance = np.inf
+        for entry in os.listdir(self.directory):
+            try:
+                with open(os.path.join(self.directory, entry, 'params.json')) as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if cached['solver'] != solver or any(cached['params'].get(k) != params.get(k) for k in same):
+                continue
+
+            distance = params_distance(params, cached['params'])
+            if distance < best_distance:
+                best_path = os.path.join(self.directory, entry)
+                best_distance = distance
+
+        return None if best_path is None else self._read(best_path, mmap_mode)
+
+    @staticmethod
+    def _read(path, mmap_mode):
+        try:
+            return (np.load(os.path.join(path, 'policy.npy'), mmap_mode=mmap_mode),
+                    np.load(os.path.join(path, 'state_value.npy'), mmap_mode=mmap_mode))
+        except OSError:
+            return None
+
+
+def params_distance(a, b):
+    """
+    Relative distance between two sets of parameters. Numbers, and lists of numbers, add their relative difference,
+    any other parameter which is different, or lists of different lengths, make them incomparable.
+    """
+    distance = 0
+    for k in set(a) | set(b):
+        x, y = a.get(k), b.get(k)
+        if x == y:
+            continue
+        try:
+            x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+            if x.shape != y.shape:
+                return np.inf
+            diff = np.abs(x - y) / np.maximum(np.maximum(np.abs(x), np.abs(y)), 1)
+        except (TypeError, ValueError):
+            return np.inf
+        distance += diff.sum()
+    return distance
+
+
+def cached_solve(cache, solver, params, solve, same=(), mmap=False):
+    """
+    Solve a problem only if it is not cached yet. Otherwise, start from the closest cached solution.
+    :param cache: SolutionCache, path of its directory or None to disable caching.
+    :param solver: name of the solver.
+    :param params: dict with the parameters of the problem.
+    :param solve: function receiving a warm start tuple (policy, state value) or None and returning the solution.
+    :param same: parameters that must be equal to warm start from a cached solution.
+    :param mmap: whether a cached solution is returned as read-only memory-mapped arrays. By default it is read
+    into ordinary arrays, like a solution which was just solved.
+    :return: policy and state value arrays.
+    """
+    if cache is None:
+        return solve(None)
+    if not isinstance(cache, SolutionCache):
+        cache = SolutionCache(cache)
+
+    solution = cache.load(solver, params, mmap_mode='r' if mmap else None)
+    if solution is not None:
+        return solution
+
+    policy, state_value = solve(cache.closest(solver, params, same))
+    cache.save(solver, params, policy, state_value)
+    return policy, state_value
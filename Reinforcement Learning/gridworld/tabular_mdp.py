@@ -0,0 +1,232 @@
+"""
+Common representation of the tabular problems and the solvers shared by all of them.
+
+A problem compiles into a TabularMDP with, for every action, a transition matrix between states and a
+vector with the expected reward of taking the action in each state. Transitions may be dense, an array of
+shape (n_actions, n_states, n_states), or sparse, a matrix of shape (n_actions * n_states, n_states) where
+row a * n_states + s holds the transitions of taking action a in state s. Terminal states simply have no
+transitions and no reward.
+
+Every solver returns the policy, the state values and a dict with the number of iterations, sweeps,
+backups and the seconds it took.
+"""
+import time
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+# Actions only replace the current one in policy iteration when they are better by more than this
+TIE_TOLERANCE = 1e-12
+
+
+class TabularMDP:
+    def __init__(self, transitions, rewards, discount=1., legal=None):
+        """
+        :param transitions: dense array, sparse matrix (see module docstring) or list with one matrix per action.
+        :param rewards: array of shape (n_actions, n_states) with the expected reward of each action in each state.
+        :param discount: discount of the next state's value.
+        :param legal: boolean array of shape (n_actions, n_states) with the actions allowed in each state.
+        """
+        if discount < 0 or discount > 1:
+            raise ValueError('discount must be between 0 and 1.')
+        if isinstance(transitions, (list, tuple)):
+            if any(sparse.issparse(t) for t in transitions):
+                transitions = sparse.vstack([sparse.csr_matrix(t) for t in transitions], format='csr')
+            else:
+                transitions = np.stack(transitions)
+        elif sparse.issparse(transitions):
+            transitions = sparse.csr_matrix(transitions)
+
+        self.transitions = transitions
+        self.rewards = np.asarray(rewards, dtype=float)
+        self.discount = discount
+        self.n_actions, self.n_states = self.rewards.shape
+        self.legal = np.ones(self.rewards.shape, dtype=bool) if legal is None else np.asarray(legal, dtype=bool)
+
+        if self.transitions.shape[-2:] != (self.n_actions * self.n_states if self.is_sparse else self.n_states,
+                                           self.n_states):
+            raise ValueError('Transitions do not match the shape of the rewards.')
+        if not self.legal.any(axis=0).all():
+            raise ValueError('Every state must have at least one legal action.')
+
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.transitions)
+
+    def q_values(self, values):
+        """
+        Expected return of every action in every state.
+        :param values: state value array.
+        :return: array of shape (n_actions, n_states), -inf for illegal actions.
+        """
+        next_values = (self.transitions @ values).reshape(self.n_actions, self.n_states)
+        return np.where(self.legal, self.rewards + self.discount * next_values, -np.inf)
+
+    def policy_model(self, policy):
+        """
+        Transition matrix and reward vector of following a policy.
+        :param policy: array with the action of each state, or array of shape (n_actions, n_states) with the
+        probability of each action in each state.
+        :return: transition matrix (sparse if the MDP is) and reward vector.
+        """
+        states = np.arange(self.n_states)
+        if policy.ndim == 1:
+            reward = self.rewards[policy, states]
+            if self.is_sparse:
+                return self.transitions[policy * self.n_states + states], reward
+            return self.transitions[policy, states], reward
+
+        reward = (policy * self.rewards).sum(axis=0)
+        if self.is_sparse:
+            weights = sparse.csr_matrix((policy.ravel(), (np.tile(states, self.n_actions),
+                                                          np.arange(self.n_actions * self.n_states))),
+                                        shape=(self.n_states, self.n_actions * self.n_states))
+            return weights @ self.transitions, reward
+        return np.einsum('as,ast->st', policy, self.transitions), reward
+
+    def initial_policy(self):
+        """First legal action of each state"""
+        return np.argmax(self.legal, axis=0)
+
+
+def _stats():
+    return {'iterations': 0, 'sweeps': 0, 'backups': 0, 'seconds': time.perf_counter()}
+
+
+def add_counts(stats, iterations=0, sweeps=0, backups=0):
+    """Add to the counts of a stats dict, creating those it does not have yet. Does nothing if stats is None"""
+    if stats is None:
+        return
+    for key, n in (('iterations', iterations), ('sweeps', sweeps), ('backups', backups)):
+        stats[key] = stats.get(key, 0) + n
+
+
+def _finish(stats):
+    stats['seconds'] = time.perf_counter() - stats['seconds']
+    return stats
+
+
+def greedy_policy(mdp, values, policy=None):
+    """
+    Greedy policy with respect to the state values.
+    :param mdp: TabularMDP.
+    :param values: state value array.
+    :param policy: current policy. If given, its actions are kept unless another one is clearly better.
+    :return: array with the action of each state.
+    """
+    q = mdp.q_values(values)
+    best = np.argmax(q, axis=0)
+    if policy is None:
+        return best
+    states = np.arange(mdp.n_states)
+    better = q[best, states] > q[policy, states] + TIE_TOLERANCE
+    return np.where(better, best, policy)
+
+
+def evaluate_policy(mdp, policy, method='direct', tolerance=1e-6, sweeps=None, values=None, stats=None):
+    """
+    State values of a policy.
+    :param mdp: TabularMDP.
+    :param policy: deterministic or stochastic policy, see TabularMDP.policy_model.
+    :param method: 'direct' solves (I - gamma * P) v = r, 'iterative' sweeps until the values change less than the
+    tolerance or the number of sweeps is reached.
+    :param tolerance: max change of the values to consider them converged.
+    :param sweeps: max number of sweeps with the iterative method.
+    :param values: values to start the iterative method from.
+    :param stats: dict where sweeps and backups are counted.
+    :return: state value array and the last change of the values (0 for the direct method).
+    """
+    transition, reward = mdp.policy_model(policy)
+    if method == 'direct':
+        if sparse.issparse(transition):
+            system = sparse.identity(mdp.n_states, format='csc') - mdp.discount * transition.tocsc()
+            values = spsolve(system, reward)
+        else:
+            values = np.linalg.solve(np.identity(mdp.n_states) - mdp.discount * transition, reward)
+        return values, 0.
+    if method != 'iterative':
+        raise NotImplementedError('Evaluation "{}" has not been implemented.'.format(method))
+
+    values = np.zeros(mdp.n_states) if values is None else np.array(values, dtype=float)
+    change = np.inf
+    n_sweeps = 0
+    while change > tolerance and (sweeps is None or n_sweeps < sweeps):
+        new_values = reward + mdp.discount * (transition @ values)
+        change = np.abs(new_values - values).max()
+        values = new_values
+        n_sweeps += 1
+    add_counts(stats, sweeps=n_sweeps, backups=n_sweeps * mdp.n_states)
+    return values, change
+
+
+def value_iteration(mdp, tolerance=1e-6, max_iter=100000, values=None, verbose=False):
+    """
+    Solve an MDP by value iteration.
+    :param mdp: TabularMDP.
+    :param tolerance: max change of the values to consider them converged.
+    :param max_iter: max number of sweeps.
+    :param values: values to start from.
+    :param verbose: whether to print the progress.
+    :return: policy, state values and stats.
+    """
+    stats = _stats()
+    values = np.zeros(mdp.n_states) if values is None else np.array(values, dtype=float)
+    change = np.inf
+    while change > tolerance and stats['iterations'] < max_iter:
+        new_values = mdp.q_values(values).max(axis=0)
+        change = np.abs(new_values - values).max()
+        values = new_values
+        stats['iterations'] += 1
+        stats['sweeps'] += 1
+        stats['backups'] += mdp.n_states
+        if verbose:
+            print('Iter {} finished! SV change: {}'.format(stats['iterations'], change))
+
+    return greedy_policy(mdp, values), values, _finish(stats)
+
+
+def policy_iteration(mdp, evaluation='direct', tolerance=1e-6, sweeps=None, max_iter=10000, policy=None,
+                     values=None, verbose=False, keep_ties=True):
+    """
+    Solve an MDP by policy iteration.
+    :param mdp: TabularMDP.
+    :param evaluation: 'direct' or 'iterative', see evaluate_policy.
+    :param tolerance: max change of the values to consider them converged.
+    :param sweeps: max number of sweeps per iterative evaluation. Limiting it gives modified policy iteration.
+    :param max_iter: max number of policy improvements.
+    :param policy: policy to start from.
+    :param values: values to start from.
+    :param verbose: whether to print the progress.
+    :param keep_ties: whether actions are only replaced by clearly better ones, see greedy_policy. Otherwise every
+    state takes its first best action.
+    :return: policy, state values and stats, which also hold the seconds spent evaluating and improving policies.
+    """
+    stats = _stats()
+    stats['evaluation_seconds'] = stats['improvement_seconds'] = 0.
+    policy = mdp.initial_policy() if policy is None else np.array(policy, dtype=int)
+    values = np.zeros(mdp.n_states) if values is None else np.array(values, dtype=float)
+
+    # Evaluations may stop short of convergence, so values must also settle before stopping
+    improvement = True
+    change = np.inf
+    while (improvement or change > tolerance) and stats['iterations'] < max_iter:
+        stats['iterations'] += 1
+        start_time = time.perf_counter()
+        values, change = evaluate_policy(mdp, policy, evaluation, tolerance, sweeps, values, stats)
+        stats['evaluation_seconds'] += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        new_policy = greedy_policy(mdp, values, policy if keep_ties else None)
+        stats['improvement_seconds'] += time.perf_counter() - start_time
+        improvement = bool((new_policy != policy).any())
+        policy = new_policy
+        if verbose:
+            print('Iter {} finished! SV change: {}. Policy improved: {}'.format(stats['iterations'], change,
+                                                                            improvement))
+
+    return policy, values, _finish(stats)
+
+
+def modified_policy_iteration(mdp, sweeps=5, tolerance=1e-6, max_iter=10000, policy=None, values=None,
+                              verbose=False):
+    """Policy iteration doing only a few sweeps to evaluate each policy"""
+    return policy_iteration(mdp, 'iterative', tolerance, sweeps, max_iter, policy, values, verbose)